@@ -4,6 +4,7 @@ Implements metrics from Flores-Anderson et al. (2023).
 """
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from scipy import stats
 from pathlib import Path
 
@@ -13,79 +14,113 @@ from _config import (
 )
 from _data_utils import (
     load_all_methods, 
-    get_valid_mask, 
-    extract_common_pixels,
-    to_db
+    stack_methods,
+    dot64
 )
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
-def calculate_cv(data):
-    """Coefficient of Variation (%)."""
-    valid = data[np.isfinite(data)]
-    if len(valid) == 0:
-        return np.nan
-    return (np.std(valid) / np.abs(np.mean(valid))) * 100
+def write_csv(df, path):
+    """Write a results table, using Arrow's C++ CSV writer when pyarrow is installed."""
+    if pa is None:
+        df.to_csv(path, index=False)
+    else:
+        # quote only where needed, as DataFrame.to_csv does for the other result files
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), str(path),
+                        write_options=pacsv.WriteOptions(quoting_style='needed'))
 
 
 def calculate_stats(data):
     """Basic statistics for backscatter array."""
-    valid = data[np.isfinite(data)]
-    if len(valid) == 0:
+    n = np.count_nonzero(np.isfinite(data))
+    if n == 0:
         return {'mean': np.nan, 'std': np.nan, 'cv': np.nan, 'n': 0}
+    mean = np.nanmean(data)
+    std = np.nanstd(data)
     return {
-        'mean': np.mean(valid),
-        'std': np.std(valid),
-        'cv': calculate_cv(data),
-        'n': len(valid)
+        'mean': mean,
+        'std': std,
+        'cv': (std / np.abs(mean)) * 100,
+        'n': n
     }
 
 
-def calculate_rmse(data1, data2):
-    """RMSE between two arrays (must be same shape)."""
-    mask = np.isfinite(data1) & np.isfinite(data2)
-    if np.sum(mask) == 0:
-        return np.nan
-    diff = data1[mask] - data2[mask]
-    return np.sqrt(np.mean(diff ** 2))
+def calculate_stats_stack(stack):
+    """Basic statistics per method for a (n_methods, H, W) stack."""
+    n = np.isfinite(stack).sum(axis=(1, 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(stack, axis=(1, 2), dtype=np.float64) / n
+        dev = stack - mean.astype(stack.dtype)[:, None, None]
+        std = np.sqrt(np.nansum(dev * dev, axis=(1, 2), dtype=np.float64) / n)
+        cv = (std / np.abs(mean)) * 100
+    return {'mean': mean, 'std': std, 'cv': cv, 'n': n}
 
 
-def calculate_bias(data1, data2):
-    """Mean bias (data1 - data2)."""
-    mask = np.isfinite(data1) & np.isfinite(data2)
-    if np.sum(mask) == 0:
-        return np.nan
-    return np.mean(data1[mask] - data2[mask])
+def _pearson_p(r, n):
+    """Two-sided p-value for Pearson r from n samples (t distribution); |r| = 1 gives p = 0."""
+    # rounding can put r just outside [-1, 1], which would make 1 - r*r negative
+    r = np.clip(r, -1.0, 1.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.abs(r) * np.sqrt((n - 2) / (1 - r * r))
+    return 2 * stats.t.sf(t, n - 2)
 
 
-def calculate_correlation(data1, data2):
-    """Pearson correlation between two arrays."""
-    mask = np.isfinite(data1) & np.isfinite(data2)
-    if np.sum(mask) < 3:
-        return np.nan, np.nan
-    r, p = stats.pearsonr(data1[mask], data2[mask])
-    return r, p
+def _compare_batch(stack, ref):
+    """
+    RMSE, bias and Pearson r of every row in stack (n_methods, N) against ref (N,),
+    each over the pixels where both are finite. Returns arrays (n, rmse, bias, r).
+    """
+    valid = np.isfinite(stack) & np.isfinite(ref)
+    n = valid.sum(axis=1)
+    x = np.where(valid, stack, 0)
+    y = np.where(valid, ref, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = x.sum(axis=1, dtype=np.float64) / n
+        my = y.sum(axis=1, dtype=np.float64) / n
+        d = x - y
+        rmse = np.sqrt(dot64(d, d) / n)
+        x = np.where(valid, x - mx.astype(x.dtype)[:, None], 0)
+        y = np.where(valid, y - my.astype(y.dtype)[:, None], 0)
+        r = dot64(x, y) / np.sqrt(dot64(x, x) * dot64(y, y))
+    r = np.clip(r, -1.0, 1.0)
+    r[n < 3] = np.nan
+    return n, rmse, mx - my, r
 
-def analyze_single_date(date_str, aoi_key, pol='vv'):
+def analyze_single_date(date_str, aoi_key, pol='vv', data_dict=None, stacked=None):
     """
-    Analyze all methods for a single date/AOI.
+    Analyze all methods for a single date/AOI. Returns a list of record dicts.
+    Pass data_dict to reuse rasters already loaded with load_all_methods,
+    and stacked = stack_methods(data_dict) to reuse the stack.
     """
-    data_dict, profile = load_all_methods(date_str, aoi_key, pol, as_db=True)
+    if data_dict is None:
+        data_dict, _ = load_all_methods(date_str, aoi_key, pol, as_db=True)
     
     if not data_dict:
         print(f"  Warning: No data for {date_str}/{aoi_key}/{pol}")
-        return None
+        return []
     
     print(f"  Loaded {len(data_dict)} methods for {aoi_key}/{pol}")
     
     # Verify all same shape
-    shapes = {k: v.shape for k, v in data_dict.items()}
-    unique_shapes = set(shapes.values())
-    if len(unique_shapes) > 1:
+    methods, stack = stacked if stacked is not None else stack_methods(data_dict)
+    if len(methods) < len(data_dict):
+        shapes = {k: v.shape for k, v in data_dict.items()}
         print(f"  Warning: Shape mismatch after alignment: {shapes}")
     
-    results = []
+    stats_arr = calculate_stats_stack(stack)
+    per_method = {m: {k: v[i] for k, v in stats_arr.items()} for i, m in enumerate(methods)}
     for method_key, data in data_dict.items():
-        stats_dict = calculate_stats(data)
+        if method_key not in per_method:
+            per_method[method_key] = calculate_stats(data)
+    
+    results = []
+    for method_key, stats_dict in per_method.items():
         results.append({
             'date': date_str,
             'aoi': aoi_key,
@@ -95,39 +130,43 @@ def analyze_single_date(date_str, aoi_key, pol='vv'):
             **stats_dict
         })
     
-    return pd.DataFrame(results)
+    return results
 
 
-def analyze_inter_product(date_str, aoi_key, pol='vv', ref_method='hyp3_gamma'):
+def analyze_inter_product(date_str, aoi_key, pol='vv', ref_method='hyp3_gamma', data_dict=None, stacked=None):
     """
-    Compare all methods against reference
+    Compare all methods against reference. Returns a list of record dicts.
+    stacked must come from stack_methods(data_dict, ref_method).
     """
-    data_dict, profile = load_all_methods(date_str, aoi_key, pol, as_db=True)
+    if data_dict is None:
+        data_dict, _ = load_all_methods(date_str, aoi_key, pol, as_db=True)
     
     if not data_dict:
-        return None
+        return []
     
     # Check if reference exists
     if ref_method not in data_dict:
         print(f"  Warning: Reference {ref_method} not available, skipping comparison")
-        return None
+        return []
     
-    ref_data = data_dict[ref_method]
-    
-    results = []
+    methods, stack = stacked if stacked is not None else stack_methods(data_dict, ref_method)
     for method_key, data in data_dict.items():
-        if method_key == ref_method:
-            continue
-        
         # Verify same shape
-        if data.shape != ref_data.shape:
-            print(f"  Warning: Shape mismatch {method_key}:{data.shape} vs ref:{ref_data.shape}")
-            continue
-        
-        rmse = calculate_rmse(data, ref_data)
-        bias = calculate_bias(data, ref_data)
-        r, p = calculate_correlation(data, ref_data)
-        
+        if method_key not in methods:
+            print(f"  Warning: Shape mismatch {method_key}:{data.shape} vs ref:{stack.shape[1:]}")
+    
+    ref_idx = methods.index(ref_method)
+    others = [i for i in range(len(methods)) if i != ref_idx]
+    if not others:
+        return []
+    
+    # All methods against the reference in one vectorised sweep
+    n, rmse, bias, r = _compare_batch(stack[others].reshape(len(others), -1),
+                                      stack[ref_idx].ravel())
+    p = _pearson_p(r, n)
+    
+    results = []
+    for i, method_key in enumerate(methods[j] for j in others):
         results.append({
             'date': date_str,
             'aoi': aoi_key,
@@ -135,15 +174,15 @@ def analyze_inter_product(date_str, aoi_key, pol='vv', ref_method='hyp3_gamma'):
             'method': method_key,
             'method_name': METHODS[method_key]['name'],
             'ref': ref_method,
-            'rmse': rmse,
-            'bias': bias,
-            'r': r,
-            'p': p
+            'rmse': rmse[i],
+            'bias': bias[i],
+            'r': r[i],
+            'p': p[i]
         })
     
-    return pd.DataFrame(results) if results else None
+    return results
 
-def run_single_date_analysis(date_str=None):
+def run_single_date_analysis(date_str=None, verbose=True):
     """Run analysis for single date (primary date if not specified)."""
     if date_str is None:
         date_str = PRIMARY_DATE
@@ -155,58 +194,63 @@ def run_single_date_analysis(date_str=None):
     
     for aoi_key in AOI_FILES.keys():
         for pol in ['vv', 'vh']:
+            data_dict, _ = load_all_methods(date_str, aoi_key, pol, as_db=True)
+            stacked = stack_methods(data_dict)
+            
             # Statistics
-            df_stats = analyze_single_date(date_str, aoi_key, pol)
-            if df_stats is not None:
-                all_stats.append(df_stats)
+            all_stats.extend(analyze_single_date(date_str, aoi_key, pol, data_dict=data_dict, stacked=stacked))
             
             # Comparison to reference
-            df_comp = analyze_inter_product(date_str, aoi_key, pol)
-            if df_comp is not None:
-                all_comparisons.append(df_comp)
+            all_comparisons.extend(analyze_inter_product(date_str, aoi_key, pol, data_dict=data_dict, stacked=stacked))
     
     # Save and display results
     stats_df = None
     comp_df = None
     
     if all_stats:
-        stats_df = pd.concat(all_stats, ignore_index=True)
-        stats_df.to_csv(RESULTS_DIR / f'stats_{date_str}.csv', index=False)
-        
+        stats_df = pd.DataFrame(all_stats)
+        write_csv(stats_df, RESULTS_DIR / f'stats_{date_str}.csv')
+    
+    if all_stats and verbose:
         print(f"\n{'='*60}")
         print(f"STATISTICS FOR {date_str}")
         print('='*60)
         
-        # Pivot table for display
-        pivot = stats_df.pivot_table(
-            values=['mean', 'cv'], 
-            index='method_name', 
-            columns=['aoi', 'pol'],
-            aggfunc='first'
-        ).round(2)
-        print(pivot)
+        # Pivot for display (method_name x aoi x pol is unique per row)
+        pivot = (stats_df.set_index(['method_name', 'aoi', 'pol'])[['mean', 'cv']]
+                 .unstack(['aoi', 'pol']))
+        print(pivot.to_string(float_format='%.2f'))
     
     if all_comparisons:
-        comp_df = pd.concat(all_comparisons, ignore_index=True)
-        comp_df.to_csv(RESULTS_DIR / f'comparison_{date_str}.csv', index=False)
-        
+        comp_df = pd.DataFrame(all_comparisons)
+        write_csv(comp_df, RESULTS_DIR / f'comparison_{date_str}.csv')
+    
+    if all_comparisons and verbose:
         print(f"\n{'='*60}")
         print(f"COMPARISON TO REFERENCE FOR {date_str}")
         print('='*60)
         
-        pivot = comp_df.pivot_table(
-            values=['rmse', 'r', 'bias'], 
-            index='method_name', 
-            columns=['aoi', 'pol'],
-            aggfunc='first'
-        ).round(3)
-        print(pivot)
+        pivot = (comp_df.set_index(['method_name', 'aoi', 'pol'])[['rmse', 'r', 'bias']]
+                 .unstack(['aoi', 'pol']))
+        print(pivot.to_string(float_format='%.3f'))
     
     return stats_df, comp_df
 
 
-def run_timeseries_analysis():
-    """Run analysis across all dates."""
+def _analyze_date(date_str):
+    """Stats and comparison records for all AOIs/pols of one date (one worker job)."""
+    stats_records, comp_records = [], []
+    for aoi_key in AOI_FILES.keys():
+        for pol in ['vv', 'vh']:
+            data_dict, _ = load_all_methods(date_str, aoi_key, pol, as_db=True)
+            stacked = stack_methods(data_dict)  # one (n_methods, H, W) copy for both analyses
+            stats_records.extend(analyze_single_date(date_str, aoi_key, pol, data_dict=data_dict, stacked=stacked))
+            comp_records.extend(analyze_inter_product(date_str, aoi_key, pol, data_dict=data_dict, stacked=stacked))
+    return stats_records, comp_records
+
+
+def run_timeseries_analysis(max_workers=None):
+    """Run analysis across all dates, one worker process per date."""
     print("\n" + "="*60)
     print("TIME SERIES ANALYSIS")
     print("="*60)
@@ -214,27 +258,18 @@ def run_timeseries_analysis():
     all_stats = []
     all_comparisons = []
     
-    for date_str in COMPARISON_DATES:
-        print(f"\nProcessing {date_str}...", end=" ")
-        
-        date_has_data = False
-        for aoi_key in AOI_FILES.keys():
-            for pol in ['vv', 'vh']:
-                df_stats = analyze_single_date(date_str, aoi_key, pol)
-                if df_stats is not None:
-                    all_stats.append(df_stats)
-                    date_has_data = True
-                
-                df_comp = analyze_inter_product(date_str, aoi_key, pol)
-                if df_comp is not None:
-                    all_comparisons.append(df_comp)
-        
-        print("✓" if date_has_data else "✗ (no data)")
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        for date_str, (stats_records, comp_records) in zip(
+                COMPARISON_DATES, ex.map(_analyze_date, COMPARISON_DATES)):
+            print(f"\nProcessing {date_str}...", end=" ")
+            all_stats.extend(stats_records)
+            all_comparisons.extend(comp_records)
+            print("✓" if stats_records else "✗ (no data)")
     
     # Save and summarize
     if all_stats:
-        stats_df = pd.concat(all_stats, ignore_index=True)
-        stats_df.to_csv(RESULTS_DIR / 'stats_timeseries.csv', index=False)
+        stats_df = pd.DataFrame(all_stats)
+        write_csv(stats_df, RESULTS_DIR / 'stats_timeseries.csv')
         
         # Summary by method and AOI
         summary = stats_df.groupby(['method_name', 'aoi', 'pol']).agg({
@@ -251,8 +286,8 @@ def run_timeseries_analysis():
         print(summary)
     
     if all_comparisons:
-        comp_df = pd.concat(all_comparisons, ignore_index=True)
-        comp_df.to_csv(RESULTS_DIR / 'comparison_timeseries.csv', index=False)
+        comp_df = pd.DataFrame(all_comparisons)
+        write_csv(comp_df, RESULTS_DIR / 'comparison_timeseries.csv')
         
         comp_summary = comp_df.groupby(['method_name', 'aoi', 'pol']).agg({
             'rmse': ['mean', 'std'],
@@ -2,13 +2,12 @@
 import numpy as np
 import pandas as pd
 from scipy import stats
-from scipy.ndimage import zoom
 import matplotlib.pyplot as plt
 
 from _config import (
     METHODS, AOI_FILES, PRIMARY_DATE, RESULTS_DIR, FIGURES_DIR
 )
-from _data_utils import load_all_methods
+from _data_utils import load_all_methods, resample_to_shape
 
 EXPECTED_DB = {'vv': -6.5, 'vh': -12.5}
 
@@ -20,18 +19,21 @@ def calc_cv(data_linear):
     return (np.std(d) / np.mean(d)) * 100
 
 
-def calc_rmse(test, ref):
+def _prep(test, ref):
     valid = np.isfinite(test) & np.isfinite(ref)
-    if valid.sum() < 10:
+    return test[valid], ref[valid]
+
+
+def calc_rmse(test, ref):
+    if test.size < 10:
         return np.nan
-    return np.sqrt(np.mean((test[valid] - ref[valid])**2))
+    return np.sqrt(np.mean((test - ref)**2))
 
 
 def calc_r2(test, ref):
-    valid = np.isfinite(test) & np.isfinite(ref)
-    if valid.sum() < 10:
+    if test.size < 10:
         return np.nan
-    r, _ = stats.pearsonr(test[valid], ref[valid])
+    r, _ = stats.pearsonr(test, ref)
     return r**2
 
 
@@ -49,8 +51,7 @@ def run_extended(date_str, aoi_key, pol='vv'):
     
     for k, v in data_dict.items():
         if v.shape != ref_shape:
-            zf = (ref_shape[0] / v.shape[0], ref_shape[1] / v.shape[1])
-            data_dict[k] = zoom(v, zf, order=1)
+            data_dict[k] = resample_to_shape(v, ref_shape)
     
     results = []
     for method, bs in data_dict.items():
@@ -68,8 +69,9 @@ def run_extended(date_str, aoi_key, pol='vv'):
         }
         
         if ref_data is not None and method != 'hyp3_gamma':
-            row['rmse_vs_ref'] = calc_rmse(bs, ref_data)
-            row['r2_vs_ref'] = calc_r2(bs.flatten(), ref_data.flatten())
+            test_v, ref_v = _prep(bs, ref_data)
+            row['rmse_vs_ref'] = calc_rmse(test_v, ref_v)
+            row['r2_vs_ref'] = calc_r2(test_v, ref_v)
         
         results.append(row)
     
@@ -198,10 +200,10 @@ def main():
     df.to_csv(RESULTS_DIR / 'extended_metrics.csv', index=False)
     
     print("\n=== CV by AOI (%) ===")
-    print(df.pivot_table(values='cv', index='method', columns='aoi').round(1))
+    print(df.groupby(['method', 'aoi'])['cv'].mean().unstack().round(1))
     
     print("\n=== RMSE vs GAMMA by AOI (dB) ===")
-    print(df.pivot_table(values='rmse_vs_ref', index='method', columns='aoi').round(3))
+    print(df.groupby(['method', 'aoi'])['rmse_vs_ref'].mean().unstack().dropna(how='all').round(3))
     
     print("\n=== Radiometric Bias (dB) ===")
     print(df.groupby(['method', 'pol'])['bias'].mean().unstack().round(2))
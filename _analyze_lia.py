@@ -1,26 +1,40 @@
 """LIA-analyse for RTC-kvalitet. God RTC: slope ≈ 0"""
+from functools import lru_cache
+
 import numpy as np
 import pandas as pd
-from scipy import stats, ndimage
-from scipy.ndimage import zoom
+from scipy import signal
 import matplotlib.pyplot as plt
 import rasterio
 
 from _config import (
-    METHODS, AOI_FILES, PRIMARY_DATE, RESULTS_DIR, FIGURES_DIR,
-    MULTITEMP_HYP3_DIR, MULTITEMP_PYROSAR_KART_DIR, MULTITEMP_PYROSAR_COP_DIR, MULTITEMP_GEE_DIR
+    METHODS, AOI_FILES, PRIMARY_DATE, RESULTS_DIR, FIGURES_DIR, OUTPUT_CRS,
+    MULTITEMP_HYP3_DIR, MULTITEMP_PYROSAR_KART_DIR, MULTITEMP_PYROSAR_COP_DIR, MULTITEMP_GEE_DIR,
+    get_aoi_bounds
 )
+from _data_utils import resample_to_shape, dot64, aoi_window
 
 FIGURES_DIR.mkdir(parents=True, exist_ok=True)
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 AOI_NO = {'jorde': 'Jordbruk', 'skog_flatt': 'Skog (flatt)', 'skog_bratt': 'Skog (bratt)'}
 
 
-def load_raster(path):
+def load_raster(path, bounds=None):
+    """Les bånd 1 som float32; med bounds (OUTPUT_CRS) leses bare AOI-vinduet."""
     if not path or not path.exists():
         return None
     with rasterio.open(path) as src:
-        return src.read(1).astype(np.float32)
+        window = aoi_window(src, bounds) if src.crs == OUTPUT_CRS else None
+        return src.read(1, window=window, out_dtype=np.float32)
+
+
+def to_db(bs):
+    """10*log10 in place for positive pixels, NaN elsewhere."""
+    valid = bs > 0
+    np.log10(bs, out=bs, where=valid)
+    bs *= 10
+    bs[~valid] = np.nan
+    return bs
 
 
 def get_bs_path(date, aoi, method, pol='vv'):
@@ -33,14 +47,23 @@ def get_bs_path(date, aoi, method, pol='vv'):
     elif method == 'gee_s1ard_kartverket':
         return MULTITEMP_GEE_DIR / date / f'{aoi}_s1ard_kartverket_{pol}.tif'
     elif method == 'pyrosar_kartverket':
-        matches = list((MULTITEMP_PYROSAR_KART_DIR / date / aoi).glob(f'*{pol.upper()}*cropped*.tif'))
-        return matches[0] if matches else None
+        return _find_cropped(MULTITEMP_PYROSAR_KART_DIR / date / aoi, pol)
     elif method == 'pyrosar_copernicus':
-        matches = list((MULTITEMP_PYROSAR_COP_DIR / date / aoi).glob(f'*{pol.upper()}*cropped*.tif'))
-        return matches[0] if matches else None
+        return _find_cropped(MULTITEMP_PYROSAR_COP_DIR / date / aoi, pol)
     return None
 
 
+@lru_cache(maxsize=None)
+def _cropped_files(directory):
+    """Beskårne GeoTIFF-er i en PyroSAR-mappe; mappen skannes én gang per prosess."""
+    return tuple(directory.glob('*cropped*.tif'))
+
+
+def _find_cropped(directory, pol):
+    pattern = f'*{pol.upper()}*cropped*.tif'
+    return next((p for p in _cropped_files(directory) if p.match(pattern)), None)
+
+
 def get_lia_path(date, aoi, method):
     if method == 'hyp3_gamma':
         return MULTITEMP_HYP3_DIR / date / f'{aoi}_hyp3_inc.tif', True
@@ -62,83 +85,116 @@ def get_lia_path(date, aoi, method):
 
 
 def find_offset(ref, test, max_shift=3):
-    ref, test = ref.copy(), test.copy()
-    ref[~np.isfinite(ref)] = 0
-    test[~np.isfinite(test)] = 0
+    ref = np.where(np.isfinite(ref), ref, 0)
+    test = np.where(np.isfinite(test), test, 0)
     if ref.std() < 1e-6 or test.std() < 1e-6:
         return (0, 0)
     ref = (ref - ref.mean()) / ref.std()
     test = (test - test.mean()) / test.std()
+    ref_m = (ref != 0).astype(np.float64)
+    test_m = (test != 0).astype(np.float64)
+    
+    # Korrelasjon for alle forskyvninger i ett FFT-pass: full-indeks (H-1+dy, W-1+dx)
+    # tilsvarer ndimage.shift(test, (dy, dx)) mot ref over felles gyldige piksler.
+    def xcorr(a, b):
+        return signal.fftconvolve(a, b[::-1, ::-1], mode='full')
+    
+    h, w = test.shape
+    win = (slice(h - 1 - max_shift, h + max_shift), slice(w - 1 - max_shift, w + max_shift))
+    n = np.rint(xcorr(ref_m, test_m)[win])
+    s_r, s_rr = xcorr(ref, test_m)[win], xcorr(ref**2, test_m)[win]
+    s_t, s_tt = xcorr(ref_m, test)[win], xcorr(ref_m, test**2)[win]
+    s_rt = xcorr(ref, test)[win]
     
-    best = (-999, (0, 0))
-    for dy in range(-max_shift, max_shift + 1):
-        for dx in range(-max_shift, max_shift + 1):
-            shifted = ndimage.shift(test, (dy, dx), order=0, mode='constant')
-            valid = (ref != 0) & (shifted != 0)
-            if valid.sum() >= 50:
-                corr = np.corrcoef(ref[valid], shifted[valid])[0, 1]
-                if corr > best[0]:
-                    best = (corr, (dy, dx))
-    return best[1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = (n*s_rt - s_r*s_t) / np.sqrt((n*s_rr - s_r**2) * (n*s_tt - s_t**2))
+    corr[(n < 50) | ~np.isfinite(corr)] = -np.inf
+    if not np.isfinite(corr.max()):
+        return (0, 0)
+    dy, dx = np.unravel_index(np.argmax(corr), corr.shape)
+    return (int(dy) - max_shift, int(dx) - max_shift)
 
 
 def calc_slope(bs, lia):
     if bs is None or lia is None:
         return {'slope': np.nan, 'r2': np.nan, 'n': 0}
     
-    bs_f, lia_f = bs.flatten(), lia.flatten()
+    bs_f, lia_f = bs.ravel(), lia.ravel()
     valid = (np.isfinite(bs_f) & np.isfinite(lia_f) & 
              (lia_f >= 15) & (lia_f <= 60) & (bs_f > -40) & (bs_f < 5))
     
     if valid.sum() < 20:
         return {'slope': np.nan, 'r2': np.nan, 'n': valid.sum()}
     
-    slope, intercept, r, _, _ = stats.linregress(lia_f[valid], bs_f[valid])
-    return {'slope': slope, 'intercept': intercept, 'r2': r**2, 'n': valid.sum(),
-            '_lia': lia_f[valid], '_bs': bs_f[valid]}
+    lia_v, bs_v = lia_f[valid], bs_f[valid]
+    n = len(lia_v)
+    # float32-data, float64-akkumulatorer
+    sx, sy = lia_v.sum(dtype=np.float64), bs_v.sum(dtype=np.float64)
+    sxx = n * dot64(lia_v, lia_v) - sx * sx
+    syy = n * dot64(bs_v, bs_v) - sy * sy
+    sxy = n * dot64(lia_v, bs_v) - sx * sy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = sxy / sxx
+        r2 = sxy * sxy / (sxx * syy)
+    intercept = (sy - slope * sx) / n
+    return {'slope': slope, 'intercept': intercept, 'r2': r2, 'n': n,
+            '_lia': lia_v, '_bs': bs_v}
 
 
-def run_analysis(date, aoi, pol='vv'):
-    hyp3_bs = load_raster(get_bs_path(date, aoi, 'hyp3_gamma', pol))
-    if hyp3_bs is None:
-        return None, None, None, None
+def load_aoi_bundle(date, aoi, pols=('vv', 'vh')):
+    """Backscatter (dB) per (metode, pol) og LIA (grader) per metode; hver fil leses én gang."""
+    bundle = {'bs': {}, 'lia': {}}
+    lia_by_path = {}
+    bounds = get_aoi_bounds(aoi, OUTPUT_CRS) if AOI_FILES[aoi].exists() else None
+    for method in METHODS:
+        for pol in pols:
+            bs = load_raster(get_bs_path(date, aoi, method, pol), bounds)
+            if bs is not None:
+                bundle['bs'][method, pol] = to_db(bs)
+        
+        # LIA er uavhengig av pol, og flere metoder deler HyP3 inc_map
+        lia_path, is_rad = get_lia_path(date, aoi, method)
+        if not lia_path or not lia_path.exists():
+            continue
+        if lia_path not in lia_by_path:
+            lia = load_raster(lia_path, bounds)
+            if lia is not None and is_rad:
+                np.rad2deg(lia, out=lia)
+            lia_by_path[lia_path] = lia
+        if lia_by_path[lia_path] is not None:
+            bundle['lia'][method] = lia_by_path[lia_path]
+    return bundle
+
+
+def run_analysis(date, aoi, pol='vv', bundle=None):
+    if bundle is None:
+        bundle = load_aoi_bundle(date, aoi, pols=(pol,))
     
-    hyp3_bs[hyp3_bs <= 0] = np.nan
-    hyp3_db = 10 * np.log10(hyp3_bs)
+    hyp3_db = bundle['bs'].get(('hyp3_gamma', pol))
+    if hyp3_db is None:
+        return None, None, None, None
     ref_shape = hyp3_db.shape
     
     results, data_dict, lia_cache, reg_cache = [], {}, {}, {}
     
     for method in METHODS:
-        bs = load_raster(get_bs_path(date, aoi, method, pol))
-        if bs is None:
-            continue
-        bs[bs <= 0] = np.nan
-        bs_db = 10 * np.log10(bs)
-        
-        lia_path, is_rad = get_lia_path(date, aoi, method)
-        if not lia_path or not lia_path.exists():
-            continue
-        lia = load_raster(lia_path)
-        if lia is None:
+        bs_db = bundle['bs'].get((method, pol))
+        lia = bundle['lia'].get(method)
+        if bs_db is None or lia is None:
             continue
-        if is_rad:
-            lia = np.rad2deg(lia)
         
         # Align
-        if bs_db.shape != ref_shape:
-            bs_db = zoom(bs_db, (ref_shape[0]/bs_db.shape[0], ref_shape[1]/bs_db.shape[1]), order=1)
-        if lia.shape != ref_shape:
-            lia = zoom(lia, (ref_shape[0]/lia.shape[0], ref_shape[1]/lia.shape[1]), order=1)
+        bs_db = resample_to_shape(bs_db, ref_shape)
+        lia = resample_to_shape(lia, ref_shape)
         
-        # Offset-korreksjon
-        # offset = (0, 0)
+        # Offset-korreksjon (av; ndimage importeres lokalt hvis den slås på)
         # if method != 'hyp3_gamma':
         #     offset = find_offset(hyp3_db, bs_db)
         #     if offset != (0, 0):
+        #         from scipy import ndimage
         #         print(f"  {method} / {aoi}: offset={offset}")
         #         bs_db = ndimage.shift(bs_db, offset, order=0, cval=np.nan)
-                #lia = ndimage.shift(lia, offset, order=0, cval=np.nan)
+        #         # lia = ndimage.shift(lia, offset, order=0, cval=np.nan)
         
         data_dict[method] = bs_db
         lia_cache[method] = lia
@@ -166,9 +222,9 @@ def plot_scatter(data_dict, lia_cache, reg_cache, aoi, pol, date):
         reg = reg_cache[method]
         lia_v, bs_v = reg['_lia'], reg['_bs']
         
-        if len(bs_v) > 2000:
-            idx_s = np.random.choice(len(bs_v), 2000, replace=False)
-            lia_v, bs_v = lia_v[idx_s], bs_v[idx_s]
+        # Jevn stride-utvalg (view, ingen N-stor permutasjon)
+        step = max(1, len(bs_v) // 2000)
+        lia_v, bs_v = lia_v[::step][:2000], bs_v[::step][:2000]
         
         ax.hexbin(lia_v, bs_v, gridsize=30, cmap='viridis', mincnt=1)
         x = np.array([15, 60])
@@ -196,9 +252,10 @@ def main():
     all_results = []
     
     for aoi in AOI_FILES:
+        bundle = load_aoi_bundle(PRIMARY_DATE, aoi)
         for pol in ['vv', 'vh']:
             print(f"{aoi}/{pol}...", end=" ")
-            res = run_analysis(PRIMARY_DATE, aoi, pol)
+            res = run_analysis(PRIMARY_DATE, aoi, pol, bundle=bundle)
             if res[0] is not None:
                 all_results.append(res[0])
                 plot_scatter(res[1], res[2], res[3], aoi, pol, PRIMARY_DATE)
@@ -213,8 +270,9 @@ def main():
     df.to_csv(RESULTS_DIR / f'lia_{PRIMARY_DATE}.csv', index=False)
     
     print("\n=== Resultater (|slope| i dB/°) ===")
-    print(df.pivot_table(values='slope', index='method', columns=['aoi', 'pol'],
-                        aggfunc=lambda x: x.abs().mean()).round(3))
+    print(df.assign(abs_slope=df['slope'].abs())
+          .groupby(['method', 'aoi', 'pol'])['abs_slope'].mean()
+          .unstack(['aoi', 'pol']).to_string(float_format='%.3f'))
     
     return df
 
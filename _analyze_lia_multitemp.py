@@ -2,7 +2,8 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from _analyze_lia import run_analysis
+from concurrent.futures import ProcessPoolExecutor
+from _analyze_lia import load_aoi_bundle, run_analysis
 from _config import METHODS, AOI_FILES, COMPARISON_DATES, RESULTS_DIR, FIGURES_DIR, DATE_METADATA
 
 FIGURES_DIR.mkdir(parents=True, exist_ok=True)
@@ -10,20 +11,27 @@ RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
 AOI_NO = {'jorde': 'Jordbruk', 'skog_flatt': 'Skog (flatt)', 'skog_bratt': 'Skog (bratt)'}
 
-def main():
+def _run_date(date_str):
+    """LIA-resultater for alle AOI/pol på én dato (én jobb per prosess)."""
+    results = []
+    for aoi in AOI_FILES:
+        bundle = load_aoi_bundle(date_str, aoi)
+        for pol in ['vv', 'vh']:
+            res = run_analysis(date_str, aoi, pol, bundle=bundle)
+            if res[0] is not None:
+                results.append(res[0])
+    return results
+
+
+def main(max_workers=None, verbose=True):
     print("MULTITEMPORAL LIA-ANALYSE\n")
     
     all_results = []
-    for date_str in COMPARISON_DATES:
-        print(f"{date_str}...", end=" ")
-        ok = False
-        for aoi in AOI_FILES:
-            for pol in ['vv', 'vh']:
-                res = run_analysis(date_str, aoi, pol)
-                if res[0] is not None:
-                    all_results.append(res[0])
-                    ok = True
-        print("OK" if ok else "FAIL")
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        for date_str, results in zip(COMPARISON_DATES, ex.map(_run_date, COMPARISON_DATES)):
+            print(f"{date_str}...", end=" ")
+            all_results.extend(results)
+            print("OK" if results else "FAIL")
     
     if not all_results:
         return None
@@ -31,23 +39,25 @@ def main():
     df = pd.concat(all_results, ignore_index=True)
     df['orbit'] = df['date'].map(DATE_METADATA)
     df.to_csv(RESULTS_DIR / 'lia_multitemporal.csv', index=False)
+    df['abs_slope'] = df['slope'].abs()
     
     # Resultater
-    print("\n=== Mean |slope| per metode ===")
-    summary = df.groupby('method')['slope'].agg(
-        mean=lambda x: x.abs().mean(),
-        std=lambda x: x.abs().std(),
+    summary = df.groupby('method')['abs_slope'].agg(
+        mean='mean',
+        std='std',
         n='count'
-    ).sort_values('mean').round(3)
-    print(summary)
-    
-    print("\n=== Per AOI ===")
-    print(df.groupby(['method', 'aoi'])['slope'].apply(lambda x: x.abs().mean()).unstack().round(3))
+    ).sort_values('mean')
+    if verbose:
+        print("\n=== Mean |slope| per metode ===")
+        print(summary.to_string(float_format='%.3f'))
+        
+        print("\n=== Per AOI ===")
+        print(df.groupby(['method', 'aoi'])['abs_slope'].mean().unstack().to_string(float_format='%.3f'))
     
     # Hovedfunn
     steep = df[df['aoi'] == 'skog_bratt']
-    rtc = steep[steep['method'] != 'gee_standard']['slope'].abs().mean()
-    no_rtc = steep[steep['method'] == 'gee_standard']['slope'].abs().mean()
+    rtc = steep[steep['method'] != 'gee_standard']['abs_slope'].mean()
+    no_rtc = steep[steep['method'] == 'gee_standard']['abs_slope'].mean()
     print(f"\nBratt terreng: RTC={rtc:.3f}, Uten RTC={no_rtc:.3f}, Forbedring={no_rtc/rtc:.1f}x")
     
     # --- FIGUR 1: Tidsserie ---
@@ -55,7 +65,7 @@ def main():
     dates = sorted(df['date'].unique())
     
     for method in summary.index:
-        mdata = df[df['method'] == method].groupby('date')['slope'].apply(lambda x: x.abs().mean())
+        mdata = df[df['method'] == method].groupby('date')['abs_slope'].mean()
         ax.plot(range(len(mdata)), mdata.values, marker=METHODS[method]['marker'],
                 color=METHODS[method]['color'], label=METHODS[method]['name'], lw=1.5, ms=5)
     
@@ -86,7 +96,7 @@ def main():
         colors = []
         labels = []
         for m in methods_order:
-            vals = aoi_df[aoi_df['method'] == m]['slope'].abs().dropna().values
+            vals = aoi_df[aoi_df['method'] == m]['abs_slope'].dropna().values
             if len(vals) > 0:
                 box_data.append(vals)
                 colors.append(METHODS[m]['color'])
@@ -112,7 +122,7 @@ def main():
     plt.close()
     
     # --- FIGUR 3: Baneretning ---
-    orbit_tbl = df.groupby(['method', 'orbit'])['slope'].apply(lambda x: x.abs().mean()).unstack()
+    orbit_tbl = df.groupby(['method', 'orbit'])['abs_slope'].mean().unstack()
     
     fig, ax = plt.subplots(figsize=(10, 5))
     x = np.arange(len(methods_order))
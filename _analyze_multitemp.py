@@ -1,24 +1,38 @@
 """Multi-temporal extended metrics - stratified by AOI."""
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')  # batch script: figures are only saved, no GUI backend
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+plt.rcParams['path.simplify'] = True
+plt.rcParams['path.simplify_threshold'] = 1.0
+plt.rcParams['agg.path.chunksize'] = 10000
+
 from _config import METHODS, AOI_FILES, COMPARISON_DATES, RESULTS_DIR, FIGURES_DIR
 from _analyze_extended import run_extended
 
 
-def main():
+def _run_date(date_str):
+    """Extended metrics for all AOIs/pols of one date (one worker job)."""
+    results = []
+    for aoi_key in AOI_FILES.keys():
+        for pol in ['vv', 'vh']:
+            df = run_extended(date_str, aoi_key, pol)
+            if df is not None:
+                results.append(df)
+    return results
+
+
+def main(max_workers=None):
     all_results = []
-    for date_str in COMPARISON_DATES:
-        print(f"{date_str}...", end=" ")
-        date_ok = False
-        for aoi_key in AOI_FILES.keys():
-            for pol in ['vv', 'vh']:
-                df = run_extended(date_str, aoi_key, pol)
-                if df is not None:
-                    all_results.append(df)
-                    date_ok = True
-        print("OK" if date_ok else "NO DATA")
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        for date_str, results in zip(COMPARISON_DATES, ex.map(_run_date, COMPARISON_DATES)):
+            print(f"{date_str}...", end=" ")
+            all_results.extend(results)
+            print("OK" if results else "NO DATA")
     
     if not all_results:
         return
@@ -26,35 +40,38 @@ def main():
     df = pd.concat(all_results, ignore_index=True)
     df.to_csv(RESULTS_DIR / 'extended_multitemporal.csv', index=False)
     
+    by_method_aoi = df.groupby(['method', 'aoi'])[['cv', 'rmse_vs_ref']].mean()
+    
     print("\n=== Mean CV by method/AOI (%) ===")
-    print(df.pivot_table(values='cv', index='method', columns='aoi').round(1))
+    print(by_method_aoi['cv'].unstack().dropna(how='all').round(1))
     
     print("\n=== Mean RMSE vs GAMMA by AOI (dB) ===")
-    print(df.pivot_table(values='rmse_vs_ref', index='method', columns='aoi').round(3))
+    print(by_method_aoi['rmse_vs_ref'].unstack().dropna(how='all').round(3))
     
-    # Time series plots
+    # Time series plots: one groupby, sliced per (aoi, method) below
+    daily = df.groupby(['aoi', 'method', 'date'])[['cv', 'rmse_vs_ref']].mean()
     all_dates = sorted(df['date'].unique())
-    date_idx = {d: i for i, d in enumerate(all_dates)}
+    date_type = pd.CategoricalDtype(all_dates, ordered=True)
+    methods = df['method'].unique()
+    style = {m: dict(marker=METHODS[m]['marker'], color=METHODS[m]['color'],
+                     label=METHODS[m]['name']) for m in methods}
     
     aoi_list = list(AOI_FILES.keys())
-    fig, axes = plt.subplots(len(aoi_list), 2, figsize=(14, 4*len(aoi_list)))
+    fig, axes = plt.subplots(len(aoi_list), 2, figsize=(14, 4*len(aoi_list)),
+                             constrained_layout=True)
+    x_ticks = range(len(all_dates))
     
     for row, aoi_key in enumerate(aoi_list):
-        aoi_data = df[df['aoi'] == aoi_key]
-        
         # CV over time
         ax = axes[row, 0]
-        for method in df['method'].unique():
-            mdata = aoi_data[aoi_data['method'] == method]
-            daily = mdata.groupby('date')['cv'].mean()
-            x_vals = [date_idx[d] for d in daily.index]
-            ax.plot(x_vals, daily.values,
-                    marker=METHODS[method]['marker'],
-                    color=METHODS[method]['color'],
-                    label=METHODS[method]['name'], alpha=0.8)
+        for method in methods:
+            if (aoi_key, method) not in daily.index:
+                continue
+            series = daily.loc[(aoi_key, method), 'cv']
+            x_vals = series.index.astype(date_type).codes
+            ax.plot(x_vals, series.values, alpha=0.8, **style[method])
         
-        ax.set_xticks(range(len(all_dates)))
-        ax.set_xticklabels(all_dates, rotation=45, ha='right', fontsize=7)
+        ax.set_xticks(x_ticks, labels=all_dates, rotation=45, ha='right', fontsize=7)
         ax.set_title(f'CV - {aoi_key}')
         ax.set_ylabel('CV (%)')
         ax.legend(fontsize=6, loc='upper right')
@@ -63,25 +80,21 @@ def main():
         
         # RMSE over time
         ax = axes[row, 1]
-        for method in df['method'].unique():
-            mdata = aoi_data[(aoi_data['method'] == method) & (aoi_data['rmse_vs_ref'].notna())]
-            if mdata.empty:
+        for method in methods:
+            if (aoi_key, method) not in daily.index:
+                continue
+            series = daily.loc[(aoi_key, method), 'rmse_vs_ref'].dropna()
+            if series.empty:
                 continue
-            daily = mdata.groupby('date')['rmse_vs_ref'].mean()
-            x_vals = [date_idx[d] for d in daily.index]
-            ax.plot(x_vals, daily.values,
-                    marker=METHODS[method]['marker'],
-                    color=METHODS[method]['color'],
-                    label=METHODS[method]['name'], alpha=0.8)
+            x_vals = series.index.astype(date_type).codes
+            ax.plot(x_vals, series.values, alpha=0.8, **style[method])
         
-        ax.set_xticks(range(len(all_dates)))
-        ax.set_xticklabels(all_dates, rotation=45, ha='right', fontsize=7)
+        ax.set_xticks(x_ticks, labels=all_dates, rotation=45, ha='right', fontsize=7)
         ax.set_title(f'RMSE vs GAMMA - {aoi_key}')
         ax.set_ylabel('RMSE (dB)')
         ax.legend(fontsize=6, loc='upper right')
         ax.grid(alpha=0.3)
     
-    plt.tight_layout()
     fig.savefig(FIGURES_DIR / 'extended_multitemporal.png', dpi=150)
     plt.close()
     
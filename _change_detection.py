@@ -1,79 +1,116 @@
+from functools import lru_cache
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from scipy import stats
 from datetime import datetime
-from rasterio.transform import rowcol
 
-from _config import METHODS, COMPARISON_DATES, FIGURES_DIR, DATE_METADATA
+from _config import METHODS, COMPARISON_DATES, FIGURES_DIR, DATE_PARSED, ORBIT_SETS
 from _config import VEG_CORRECTION_COEFS as VCC
 from _data_utils import load_all_methods
 
+# Løpende histogram for kalibreringspersentiler: [-40, 10] dB i 0.01 dB-bins
+CALIB_EDGES = np.linspace(-40, 10, 5001)
+
 
 def match_dates(sar_dates, field_dates, max_days=3):
     """Match SAR-datoer til nærmeste feltmåling."""
-    matches = []
-    for s in sar_dates:
-        sd = datetime.strptime(s, '%Y%m%d')
-        closest = min(field_dates, key=lambda f: abs((f - sd).days))
-        if abs((closest - sd).days) <= max_days:
-            matches.append((s, closest))
-    return matches
+    if len(sar_dates) == 0 or len(field_dates) == 0:
+        return []
+    sar_d = np.array([datetime.strptime(s, '%Y%m%d') for s in sar_dates], dtype='datetime64[D]')
+    field_d = np.asarray(field_dates, dtype='datetime64[D]')
+    # Avstand i dager for alle (SAR, felt)-par; første minimum som min() over feltdatoene
+    diff = np.abs(sar_d[:, None] - field_d[None, :]).astype(np.int64)
+    idx = diff.argmin(axis=1)
+    close = diff[np.arange(len(sar_d)), idx] <= max_days
+    return [(s, field_dates[i]) for s, i, ok in zip(sar_dates, idx, close) if ok]
 
 
 def filter_dates(date_list, months=None, orbit=None):
     """Filtrer datoer på måned og/eller baneretning."""
+    def key(d):
+        return d[0] if isinstance(d, tuple) else d
+    
     result = date_list
     if months:
-        result = [d for d in result 
-                  if datetime.strptime(d[0] if isinstance(d, tuple) else d, '%Y%m%d').month in months]
+        months = set(months)
+        result = [d for d in result
+                  if (DATE_PARSED.get(key(d)) or datetime.strptime(key(d), '%Y%m%d')).month in months]
     if orbit:
-        result = [d for d in result 
-                  if DATE_METADATA.get(d[0] if isinstance(d, tuple) else d) == orbit]
+        orbit_dates = ORBIT_SETS.get(orbit, frozenset())
+        result = [d for d in result if key(d) in orbit_dates]
     return result
 
 
 def extract_at_points(raster, transform, x_coords, y_coords):
-    """Ekstraher rasterverdier ved punktkoordinater."""
-    values = []
-    for x, y in zip(x_coords, y_coords):
-        row, col = rowcol(transform, x, y)
-        if 0 <= row < raster.shape[0] and 0 <= col < raster.shape[1]:
-            values.append(raster[row, col])
-        else:
-            values.append(np.nan)
-    return np.array(values)
+    """Ekstraher rasterverdier ved punktkoordinater (NaN utenfor rasteret)."""
+    # Invers affin gir (kolonne, rad) for alle punkter på én gang, som rowcol()
+    cols, rows = ~transform * (np.asarray(x_coords, dtype=np.float64),
+                               np.asarray(y_coords, dtype=np.float64))
+    rows = np.floor(rows).astype(np.intp)
+    cols = np.floor(cols).astype(np.intp)
+    valid = (rows >= 0) & (rows < raster.shape[0]) & (cols >= 0) & (cols < raster.shape[1])
+    values = np.full(len(rows), np.nan, dtype=np.result_type(raster.dtype, np.float32))
+    values[valid] = raster[rows[valid], cols[valid]]
+    return values
+
+
+def _hist_percentiles(hist, edges, q):
+    """Persentiler (0-100) fra et histogram; returnerer midtpunktet av bin-en persentilen faller i."""
+    cdf = np.cumsum(hist)
+    idx = np.searchsorted(cdf, np.asarray(q) / 100 * cdf[-1])
+    idx = np.minimum(idx, len(hist) - 1)
+    return 0.5 * (edges[idx] + edges[idx + 1])
+
+
+def _gamma_to_sm(gamma, gamma_min, gamma_max, sm_min, sm_max, clip=False):
+    """Lineær skalering av backscatter (dB) til jordfuktighet, valgfritt klippet til [sm_min, sm_max]."""
+    gamma_norm = (gamma - gamma_min) / (gamma_max - gamma_min)
+    if clip:
+        np.clip(gamma_norm, 0, 1, out=gamma_norm)
+    return gamma_norm * (sm_max - sm_min) + sm_min
 
 
 def validate_method(method_key, field_df, matched_dates, aoi='jorde', pol='vv', veg_correction=False):
     """Valider en preprosesseringsmetode mot feltdata."""
-    all_bs = []
+    # Last hver dato én gang; samme raster brukes til kalibrering og validering
+    loaded = {}
     for sar_date, _ in matched_dates:
-        data_dict, _ = load_all_methods(sar_date, aoi, pol, as_db=True)
-        if method_key in data_dict:
-            gamma = data_dict[method_key]
-            all_bs.append(gamma[np.isfinite(gamma)])
+        if sar_date not in loaded:
+            data_dict, transform = load_all_methods(sar_date, aoi, pol, as_db=True,
+                                                    methods={method_key})
+            loaded[sar_date] = (data_dict.get(method_key), transform)
     
-    if not all_bs:
-        return None
+    # Persentilgrunnlag: alle gyldige piksler akkumuleres i et fast histogram (konstant minne)
+    hist = np.zeros(len(CALIB_EDGES) - 1, dtype=np.int64)
+    n_dates = 0
+    for gamma, _ in loaded.values():
+        if gamma is None:
+            continue
+        finite = gamma[np.isfinite(gamma)]
+        # Verdier utenfor området telles i ytterste bin
+        np.clip(finite, CALIB_EDGES[0], CALIB_EDGES[-1], out=finite)
+        hist += np.histogram(finite, bins=CALIB_EDGES)[0]
+        n_dates += 1
     
-    all_bs = np.concatenate(all_bs)
+    if n_dates == 0:
+        return None
 
-    if all_bs.size == 0:
+    if hist.sum() == 0:
         print(f"Ingen gyldige bakkspredningsverdier funnet for kalibrering av {method_key}.")
         return None
     
-    # find percentile limits
-    gamma_min = np.percentile(all_bs, 5)
-    gamma_max = np.percentile(all_bs, 95)
+    # find percentile limits (bin midpoint, 0.01 dB resolution)
+    gamma_min, gamma_max = _hist_percentiles(hist, CALIB_EDGES, (5, 95))
     sm_min = field_df['theta_median'].min()
     sm_max = field_df['theta_median'].max()
     
     all_field, all_sar = [], []
     
     for sar_date, field_date in matched_dates:
-        data_dict, transform = load_all_methods(sar_date, aoi, pol, as_db=True)
-        if method_key not in data_dict or transform is None:
+        gamma, transform = loaded[sar_date]
+        if gamma is None or transform is None:
             continue
         
         field_subset = field_df[field_df['dato'] == field_date]
@@ -91,28 +128,23 @@ def validate_method(method_key, field_df, matched_dates, aoi='jorde', pol='vv',
         if gamma_max_veg <= gamma_min:
             gamma_max_veg = gamma_max
         
-        gamma = data_dict[method_key]
-        if(veg_correction):
-            gamma_norm = np.clip((gamma - gamma_min) / (gamma_max_veg - gamma_min), 0, 1)
-        else:
-            gamma_norm = (gamma - gamma_min) / (gamma_max_veg - gamma_min)
-
-        sm_map = gamma_norm * (sm_max - sm_min) + sm_min
-        
-        sm_sar = extract_at_points(sm_map, transform, 
-                                   field_subset['x'].values, 
-                                   field_subset['y'].values)
+        # Skaleringen er punktvis: sample gamma ved feltpunktene og skaler bare dem
+        gamma_pts = extract_at_points(gamma, transform,
+                                      field_subset['x'].values,
+                                      field_subset['y'].values).astype(np.float64)
+        sm_sar = _gamma_to_sm(gamma_pts, gamma_min, gamma_max_veg, sm_min, sm_max,
+                              clip=veg_correction)
         sm_field = field_subset['theta_median'].values
         
         valid = np.isfinite(sm_sar) & np.isfinite(sm_field)
         if valid.sum() >= 3:
-            all_field.extend(sm_field[valid])
-            all_sar.extend(sm_sar[valid])
+            all_field.append(sm_field[valid])
+            all_sar.append(sm_sar[valid])
     
     if not all_field:
         return None
     
-    all_field, all_sar = np.array(all_field), np.array(all_sar)
+    all_field, all_sar = np.concatenate(all_field), np.concatenate(all_sar)
     r, _ = stats.pearsonr(all_field, all_sar)
     
     return {
@@ -172,10 +204,15 @@ def plot_results(results, suffix='', title=''):
     plt.show()
 
 
+@lru_cache(maxsize=None)
+def _load_field(path='data/input_cleaned.csv'):
+    """Feltdata, lest én gang per prosess (main kalles flere ganger). Ikke muter resultatet."""
+    return pd.read_csv(path, parse_dates=['dato'])
+
+
 def main(months=None, orbit=None, veg_correction=False):
     """Run soil moisture validation."""
-    field_df = pd.read_csv('data/input_cleaned.csv')
-    field_df['dato'] = pd.to_datetime(field_df['dato'])
+    field_df = _load_field()
     
     matched = match_dates(COMPARISON_DATES, field_df['dato'].unique(), max_days=3)
     matched = filter_dates(matched, months=months, orbit=orbit)
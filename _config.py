@@ -1,9 +1,22 @@
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 import geopandas as gpd
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
+# Vectorised GDAL-backed reader for AOI files when installed (default in GeoPandas >= 1.0)
+try:
+    import pyogrio  # noqa: F401
+    AOI_READ_KWARGS = {'engine': 'pyogrio'}
+except ImportError:
+    AOI_READ_KWARGS = {}
+
+# GDAL block cache (MB) and no sidecar directory listing on open
+os.environ.setdefault('GDAL_CACHEMAX', '512')
+os.environ.setdefault('GDAL_DISABLE_READDIR_ON_OPEN', 'EMPTY_DIR')
+
 GEE_PROJECT = os.getenv('GEE_PROJECT')
 OUTPUT_CRS = 'EPSG:32632'  # UTM 32N
 OUTPUT_RESOLUTION = 10
@@ -91,6 +104,13 @@ DATE_METADATA = {
     '20171016':'Ascending'
 }
 
+# Parsed dates and orbit membership, computed once for the date filters
+DATE_PARSED = {d: datetime.strptime(d, '%Y%m%d') for d in COMPARISON_DATES}
+ORBIT_SETS = {
+    orbit: frozenset(d for d, o in DATE_METADATA.items() if o == orbit)
+    for orbit in set(DATE_METADATA.values())
+}
+
 METHODS = {
     'hyp3_gamma': {
         'name': 'HyP3 GAMMA (Cop. 30m)',
@@ -136,12 +156,21 @@ METHODS = {
     }
 }
 
-def load_aoi(aoi_key):
-    """Load AOI geometry from geojson file."""
+@lru_cache(maxsize=None)
+def _read_aoi(aoi_key):
     path = AOI_FILES[aoi_key]
     if not path.exists():
         raise FileNotFoundError(f"AOI file not found: {path}")
-    return gpd.read_file(path)
+    return gpd.read_file(path, **AOI_READ_KWARGS)
+
+def load_aoi(aoi_key):
+    """Load AOI geometry from geojson file (parsed once, returned as a copy)."""
+    return _read_aoi(aoi_key).copy()
+
+@lru_cache(maxsize=None)
+def get_aoi_in_crs(aoi_key, crs_wkt):
+    """AOI geometries reprojected to crs_wkt, cached per (AOI, CRS)."""
+    return tuple(_read_aoi(aoi_key).to_crs(crs_wkt).geometry)
 
 def get_aoi_bounds(aoi_key, crs=None):
     """Get AOI bounds, optionally reprojected."""
@@ -157,11 +186,17 @@ def get_aoi_geometry(aoi_key, crs=None):
         gdf = gdf.to_crs(crs)
     return gdf.geometry.iloc[0]
 
+_SAFE_PATHS = {}
+
 def get_safe_path(date_str):
-    """Find SAFE file for a given date."""
-    pattern = f"S1*_{date_str}T*.SAFE"
-    matches = list(ALL_RAW_DIR.glob(pattern))
-    return matches[0] if matches else None
+    """Find SAFE file for a given date (found paths are cached; misses are re-scanned, e.g. after a download)."""
+    path = _SAFE_PATHS.get(date_str)
+    if path is None:
+        pattern = f"S1*_{date_str}T*.SAFE"
+        matches = list(ALL_RAW_DIR.glob(pattern))
+        if matches:
+            path = _SAFE_PATHS[date_str] = matches[0]
+    return path
 
 def get_hyp3_path(date_str, aoi_key, pol):
     """Path to HyP3 output."""
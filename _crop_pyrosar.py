@@ -4,7 +4,9 @@ to the exact AOI geometry defined in _config.py.
 Handles VV, VH, incidence angles, and masks similar to the HyP3 workflow.
 """
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import rasterio
 from rasterio.mask import mask
 
@@ -12,12 +14,34 @@ try:
     from _config import (
         COMPARISON_DATES, AOI_FILES,
         MULTITEMP_PYROSAR_KART_DIR, MULTITEMP_PYROSAR_COP_DIR,
-        load_aoi
+        get_aoi_in_crs
     )
 except ImportError:
     print("ERROR: Could not import _config.py.")
     exit()
 
+# PyroSAR output patterns and the suffixes used for the cropped copies.
+# Naming convention: {aoi}_{suffix}_cropped.tif
+# Note: Adjust the glob patterns if your file naming varies slightly
+PYROSAR_PATTERNS = {
+    'vv': '*_VV_gamma0-rtc.tif',
+    'vh': '*_VH_gamma0-rtc.tif',
+    'inc': '*_incidenceAngleFromEllipsoid.tif',
+    'ls': '*_layoverShadowMask.tif',
+    'local_inc': '*_localIncidenceAngle.tif'
+}
+CROPPED_SUFFIXES = {
+    'vv': 'VV_gamma0-rtc',
+    'vh': 'VH_gamma0-rtc',
+    'inc': 'incidenceAngleFromEllipsoid',
+    'ls': 'layoverShadowMask',
+    'local_inc': 'localIncidenceAngle'
+}
+
+def cropped_output_path(target_dir: Path, aoi_key: str, file_type: str):
+    suffix = CROPPED_SUFFIXES.get(file_type, file_type)
+    return target_dir / f"{aoi_key}_{suffix}_cropped.tif"
+
 def get_pyrosar_filename_map(output_dir: Path):
     """
     Scans the directory for PyroSAR outputs and maps them to standard keys.
@@ -27,18 +51,8 @@ def get_pyrosar_filename_map(output_dir: Path):
         return {}
 
     file_map = {}
-    
-    # Define patterns to search for based on PyroSAR naming conventions
-    # Note: Adjust the glob patterns if your file naming varies slightly
-    patterns = {
-        'vv': '*_VV_gamma0-rtc.tif',
-        'vh': '*_VH_gamma0-rtc.tif',
-        'inc': '*_incidenceAngleFromEllipsoid.tif',
-        'ls': '*_layoverShadowMask.tif',
-        'local_inc': '*_localIncidenceAngle.tif'
-    }
-
-    for key, pattern in patterns.items():
+
+    for key, pattern in PYROSAR_PATTERNS.items():
         matches = list(output_dir.glob(pattern))
         if matches:
             # Take the first match (there should usually be only one per folder/date)
@@ -54,15 +68,12 @@ def crop_raster_to_aoi(input_path: Path, output_path: Path, aoi_key: str):
         return  # Skip if already cropped
 
     try:
-        # Load AOI
-        gdf = load_aoi(aoi_key)
-
         with rasterio.open(input_path) as src:
-            # Reproject AOI to match the raster's CRS
-            gdf_proj = gdf.to_crs(src.crs)
+            # AOI reprojected to the raster's CRS (cached per AOI and CRS)
+            geoms = get_aoi_in_crs(aoi_key, src.crs.to_wkt())
             
             # Perform the crop
-            out_image, out_transform = mask(src, gdf_proj.geometry, crop=True, filled=True, nodata=0)
+            out_image, out_transform = mask(src, geoms, crop=True, filled=True, nodata=0)
             
             # Update metadata
             out_meta = src.meta.copy()
@@ -72,7 +83,13 @@ def crop_raster_to_aoi(input_path: Path, output_path: Path, aoi_key: str):
                 "width": out_image.shape[2],
                 "transform": out_transform,
                 "nodata": 0,
-                "compress": "lzw"
+                "compress": "lzw",
+                # Tiled + predictor: smaller files and cheap windowed reads downstream
+                "tiled": True,
+                "blockxsize": 256,
+                "blockysize": 256,
+                "predictor": 3 if np.dtype(src.dtypes[0]).kind == 'f' else 2,
+                "BIGTIFF": "IF_SAFER"
             })
 
             # Save cropped file
@@ -86,18 +103,27 @@ def crop_raster_to_aoi(input_path: Path, output_path: Path, aoi_key: str):
         if output_path.exists():
             os.remove(output_path)
 
-def main():
+def _crop_one(job):
+    crop_raster_to_aoi(*job)
+
+def main(max_workers=None):
     processing_targets = [
         (MULTITEMP_PYROSAR_KART_DIR, "Kartverket"),
         (MULTITEMP_PYROSAR_COP_DIR, "Copernicus")
     ]
 
+    # Collect independent crop jobs (distinct output paths), then run them in parallel
+    jobs = []
     for date in COMPARISON_DATES:
         for aoi_key in AOI_FILES.keys():
             for base_dir, label in processing_targets:
                 
                 # The folder where PyroSAR put the original results
                 target_dir = base_dir / date / aoi_key
+
+                # Re-runs: nothing to do if every cropped output is already there
+                if all(cropped_output_path(target_dir, aoi_key, t).exists() for t in PYROSAR_PATTERNS):
+                    continue
                 
                 # Find all available files in that folder
                 file_map = get_pyrosar_filename_map(target_dir)
@@ -110,27 +136,22 @@ def main():
 
                 # Iterate through found files and crop them
                 for file_type, input_path in file_map.items():
-                    
-                    # Define output name. 
-                    # Naming convention: {aoi}_{type}_cropped.tif
-                    # You can adjust suffix as needed.
-                    suffix_map = {
-                        'vv': 'VV_gamma0-rtc',
-                        'vh': 'VH_gamma0-rtc',
-                        'inc': 'incidenceAngleFromEllipsoid',
-                        'ls': 'layoverShadowMask',
-                        'local_inc': 'localIncidenceAngle'
-                    }
-                    
-                    suffix = suffix_map.get(file_type, file_type)
-                    output_filename = f"{aoi_key}_{suffix}_cropped.tif"
-                    output_path = target_dir / output_filename
+                    output_path = cropped_output_path(target_dir, aoi_key, file_type)
+                    if output_path.exists():
+                        continue
 
                     # Don't crop if the input file IS the cropped file (safety check)
                     if "cropped" in input_path.name:
                         continue
 
-                    crop_raster_to_aoi(input_path, output_path, aoi_key)
+                    jobs.append((input_path, output_path, aoi_key))
+
+    if not jobs:
+        return
+
+    print(f"Cropping {len(jobs)} rasters...")
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        list(ex.map(_crop_one, jobs))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,17 +2,26 @@
 Fixed data utilities - ensures we load CROPPED PyroSAR files.
 Replace your _data_utils.py with this or update the relevant functions.
 """
+import math
+import shutil
+import zipfile
 import numpy as np
 import rasterio
+from rasterio.errors import WindowError
+from rasterio.warp import reproject, Resampling
+from rasterio.transform import array_bounds
+from rasterio.windows import Window, from_bounds
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
 from scipy.ndimage import zoom
 
 # Import your config
 from _config import (
-    METHODS, AOI_FILES,
+    METHODS, AOI_FILES, OUTPUT_CRS,
     MULTITEMP_HYP3_DIR, MULTITEMP_GEE_DIR,
     MULTITEMP_PYROSAR_KART_DIR, MULTITEMP_PYROSAR_COP_DIR,
-    load_aoi
+    load_aoi, get_aoi_bounds
 )
 
 
@@ -73,41 +82,179 @@ def find_pyrosar_lia(date_str, aoi_key, dem_type='kartverket'):
     return None
 
 
-def load_raster(path, aoi_key=None, as_db=False):
-    """Load raster, optionally convert to dB."""
+def _read_window(src, aoi_key, bounds=None):
+    if bounds is not None:
+        return aoi_window(src, bounds)
+    if aoi_key is None or not AOI_FILES[aoi_key].exists():
+        return None
+    return aoi_window(src, get_aoi_bounds(aoi_key, src.crs))
+
+
+def raster_grid(path, aoi_key=None):
+    """(shape, transform) that load_raster would return, read from the header only."""
+    with rasterio.open(path) as src:
+        window = _read_window(src, aoi_key)
+        if window is None:
+            return src.shape, src.transform
+        return (int(window.height), int(window.width)), src.window_transform(window)
+
+
+def load_raster(path, aoi_key=None, as_db=False, bounds=None):
+    """
+    Load raster, optionally convert to dB. With aoi_key, only the AOI window of a larger scene is read;
+    bounds (in the raster's CRS) overrides the AOI bounds.
+    """
     if path is None or not Path(path).exists():
         return None, None
     
     with rasterio.open(path) as src:
-        data = src.read(1).astype(np.float32)
-        transform = src.transform
-    
-    # Mask invalid
-    data[data <= 0] = np.nan
+        window = _read_window(src, aoi_key, bounds)
+        data = src.read(1, window=window, out_dtype=np.float32)
+        transform = src.transform if window is None else src.window_transform(window)
     
+    # Mask invalid (and convert to dB) in place on the float32 buffer
+    valid = data > 0
     if as_db:
-        data = 10 * np.log10(data)
+        np.log10(data, out=data, where=valid)
+        data *= 10
+    data[~valid] = np.nan
     
     return data, transform
 
 
-def load_all_methods(date_str, aoi_key, pol='vv', as_db=True):
+def aoi_window(src, bounds, max_frac=0.5, pad=2):
+    """
+    Pixel window covering bounds (in the raster's CRS), or None to read the full band.
+    Offsets are floored, lengths ceiled and `pad` pixels added on each side, so a later
+    bilinear reproject onto a grid covering the same bounds has full kernel support.
+    Pre-cropped rasters (AOI covers most of the raster) are read whole so their shapes stay unchanged.
+    """
+    if bounds is None:
+        return None
+    window = from_bounds(*bounds, transform=src.transform)
+    col0 = math.floor(window.col_off) - pad
+    row0 = math.floor(window.row_off) - pad
+    col1 = math.ceil(window.col_off + window.width) + pad
+    row1 = math.ceil(window.row_off + window.height) + pad
+    window = Window(col0, row0, col1 - col0, row1 - row0)
+    try:
+        window = window.intersection(Window(0, 0, src.width, src.height))
+    except WindowError:
+        return None
+    if window.width * window.height > max_frac * src.width * src.height:
+        return None
+    return window
+
+
+def resample_to_shape(data, shape):
+    """
+    Resample 2-D array to shape.
+    Integer downsampling (e.g. 10 m -> 30 m) is a block mean; other ratios use bilinear zoom.
+    """
+    if data.shape == tuple(shape):
+        return data
+    h, w = shape
+    f = int(round(data.shape[0] / h))
+    if f >= 2 and 0 <= data.shape[0] - f * h <= 1 and 0 <= data.shape[1] - f * w <= 1:
+        return data[:f * h, :f * w].reshape(h, f, w, f).mean(axis=(1, 3))
+    return zoom(data, (h / data.shape[0], w / data.shape[1]), order=1)
+
+
+def _extract_members(zip_path, members, buffer_size):
+    """Copy (ZipInfo, target) pairs out of zip_path through its own ZipFile handle."""
+    with zipfile.ZipFile(zip_path, 'r') as z:
+        for info, target in members:
+            with z.open(info) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, length=buffer_size)
+
+
+def extract_zip(zip_path, dest_dir, buffer_size=1 << 20, max_workers=1):
+    """
+    Extract a (large) zip into dest_dir, copying each member with a 1 MiB buffer.
+    With max_workers > 1, members are split over threads, each with its own ZipFile
+    (ZipFile handles are not thread-safe; zlib releases the GIL while inflating).
+    """
+    dest_dir = Path(dest_dir).resolve()
+    members = []
+    with zipfile.ZipFile(zip_path, 'r') as z:
+        for info in z.infolist():
+            target = (dest_dir / info.filename).resolve()
+            if not target.is_relative_to(dest_dir):
+                raise ValueError(f"Unsafe path in {Path(zip_path).name}: {info.filename}")
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            members.append((info, target))
+    
+    if max_workers <= 1 or len(members) <= 1:
+        _extract_members(zip_path, members, buffer_size)
+        return
+    
+    n = min(max_workers, len(members))
+    with ThreadPoolExecutor(max_workers=n) as ex:
+        futures = [ex.submit(_extract_members, zip_path, members[i::n], buffer_size) for i in range(n)]
+        for fut in futures:
+            fut.result()
+
+
+def build_scene_index(dates, aoi_key='jorde'):
     """
-    Load backscatter from all methods
+    One ASF search over the whole date span instead of one per date.
+    Returns {date_str: granule} with the first S1 GRD_HD scene within +/- 1 day of each date.
+    """
+    import asf_search as asf
+    
+    date_dts = {d: datetime.strptime(d, '%Y%m%d') for d in dates}
+    if not date_dts:
+        return {}
+    
+    aoi_gdf = load_aoi(aoi_key).to_crs('EPSG:4326')
+    results = asf.search(
+        platform=[asf.PLATFORM.SENTINEL1],
+        intersectsWith=str(aoi_gdf.geometry.iloc[0]),
+        start=(min(date_dts.values()) - timedelta(days=1)).strftime('%Y-%m-%d'),
+        end=(max(date_dts.values()) + timedelta(days=1)).strftime('%Y-%m-%d'),
+        processingLevel='GRD_HD',
+        beamMode='IW',
+    )
+    
+    starts = [datetime.fromisoformat(g.properties['startTime'].replace('Z', '+00:00')).replace(tzinfo=None)
+              for g in results]
+    index = {}
+    for date_str, date_dt in date_dts.items():
+        for granule, start in zip(results, starts):
+            if abs(start - date_dt) <= timedelta(days=1):
+                index[date_str] = granule
+                break
+    return index
+
+
+def load_all_methods(date_str, aoi_key, pol='vv', as_db=True, methods=None):
+    """
+    Load backscatter from all methods (or only the keys in methods)
     Returns dict of {method_key: data_array} and reference transform.
     """
+    def wanted(method_key):
+        return methods is None or method_key in methods
+    
     data_dict = {}
     ref_transform = None
     ref_shape = None
+    grid_transform = None  # transform of the grid ref_shape belongs to
     
     # HyP3 (reference)
     hyp3_path = MULTITEMP_HYP3_DIR / date_str / f'{aoi_key}_hyp3_{pol}.tif'
-    if hyp3_path.exists():
-        data, transform = load_raster(hyp3_path, as_db=as_db)
+    if hyp3_path.exists() and wanted('hyp3_gamma'):
+        data, transform = load_raster(hyp3_path, aoi_key, as_db=as_db)
         if data is not None:
             data_dict['hyp3_gamma'] = data
-            ref_transform = transform
+            ref_transform = grid_transform = transform
             ref_shape = data.shape
+    elif hyp3_path.exists():
+        # Reference grid only: header read, no band decode
+        ref_shape, ref_transform = raster_grid(hyp3_path, aoi_key)
+        grid_transform = ref_transform
     
     # GEE methods
     gee_methods = [
@@ -118,31 +265,59 @@ def load_all_methods(date_str, aoi_key, pol='vv', as_db=True):
     
     for method_key, filename in gee_methods:
         path = MULTITEMP_GEE_DIR / date_str / filename
-        if path.exists():
-            data, _ = load_raster(path, as_db=as_db)
+        if wanted(method_key) and path.exists():
+            data, transform = load_raster(path, aoi_key, as_db=as_db)
             if data is not None:
                 data_dict[method_key] = data
                 if ref_shape is None:
                     ref_shape = data.shape
+                    grid_transform = transform
     
     # PyroSAR methods
     for dem_type, method_key in [('kartverket', 'pyrosar_kartverket'), 
                                   ('copernicus', 'pyrosar_copernicus')]:
+        if not wanted(method_key):
+            continue
         path = find_pyrosar_file(date_str, aoi_key, pol, dem_type)
         if path and path.exists():
-            data, _ = load_raster(path, as_db=as_db)
+            # Read the window covering the reference grid (not the AOI) so bilinear has support at its edges
+            grid_bounds = array_bounds(*ref_shape, grid_transform) if ref_shape else None
+            data, transform = load_raster(path, aoi_key, as_db=as_db, bounds=grid_bounds)
             if data is not None:
-                # Resample if shape mismatch
-                if ref_shape and data.shape != ref_shape:
+                # Resample onto the reference grid if grids differ (bilinear, georeferenced)
+                if ref_shape and (data.shape != ref_shape or transform != grid_transform):
                     print(f"  Resampling {method_key}: {data.shape} → {ref_shape}")
-                    zoom_factors = (ref_shape[0] / data.shape[0], 
-                                   ref_shape[1] / data.shape[1])
-                    data = zoom(data, zoom_factors, order=1)
+                    resampled = np.full(ref_shape, np.nan, dtype=np.float32)
+                    reproject(data, resampled,
+                              src_transform=transform, src_crs=OUTPUT_CRS, src_nodata=np.nan,
+                              dst_transform=grid_transform, dst_crs=OUTPUT_CRS, dst_nodata=np.nan,
+                              resampling=Resampling.bilinear)
+                    data = resampled
                 data_dict[method_key] = data
     
     return data_dict, ref_transform
 
 
+def dot64(a, b):
+    """Dot product over the last axis of (float32) arrays, accumulated in float64."""
+    return np.einsum('...i,...i->...', a, b, dtype=np.float64)
+
+
+def stack_methods(data_dict, ref_method='hyp3_gamma'):
+    """
+    Stack methods into one contiguous float32 array of shape (n_methods, H, W).
+    The grid is the reference method's (or the first method's); methods on other grids are left out.
+    Returns (methods, stack) with methods[i] labelling stack[i].
+    """
+    if not data_dict:
+        return [], None
+    ref_shape = (data_dict[ref_method] if ref_method in data_dict
+                 else next(iter(data_dict.values()))).shape
+    methods = [k for k, v in data_dict.items() if v.shape == ref_shape]
+    stack = np.stack([data_dict[k].astype(np.float32, copy=False) for k in methods])
+    return methods, stack
+
+
 def verify_file_availability(date_str, aoi_key):
     """Check which files exist and their properties."""
     print(f"\n{'='*60}")
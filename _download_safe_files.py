@@ -3,9 +3,7 @@ Download Sentinel-1 SAFE files from ASF for specified dates.
 """
 
 import os
-import zipfile
 from pathlib import Path
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,9 +15,8 @@ except ImportError as e:
     print("Install with: pip install asf_search")
     exit(1)
 
-from _config import (
-    COMPARISON_DATES, ALL_RAW_DIR, load_aoi, get_safe_path
-)
+from _config import COMPARISON_DATES, ALL_RAW_DIR, get_safe_path
+from _data_utils import extract_zip, build_scene_index
 
 # config
 HYP3_USERNAME = os.getenv('HYP3USERNAME')
@@ -35,9 +32,6 @@ def download_safe_files(dates_to_download, overwrite=False):
     print("Authenticating with ASF...")
     session = asf.ASFSession().auth_with_creds(HYP3_USERNAME, HYP3_PASSWORD)
     
-    # Use jorde AOI for search (covers the area)
-    aoi_gdf = load_aoi('jorde').to_crs('EPSG:4326')
-    
     print("=" * 70)
     print("DOWNLOADING SAFE FILES")
     print("=" * 70)
@@ -48,6 +42,12 @@ def download_safe_files(dates_to_download, overwrite=False):
     
     downloaded, skipped, failed = [], [], []
     
+    # One ASF search for all dates still missing (jorde AOI covers the area)
+    missing = [d for d in dates_to_download if overwrite or not get_safe_path(d)]
+    if missing:
+        print(f"\nSearching ASF for {len(missing)} dates...")
+    scene_index = build_scene_index(missing, 'jorde') if missing else {}
+    
     for date_str in dates_to_download:
         print(f"\n{'─' * 50}")
         print(f"DATE: {date_str}")
@@ -60,28 +60,13 @@ def download_safe_files(dates_to_download, overwrite=False):
             skipped.append(date_str)
             continue
         
-        # Search for scene
-        date_dt = datetime.strptime(date_str, '%Y%m%d')
-        start = (date_dt - timedelta(days=1)).strftime('%Y-%m-%d')
-        end = (date_dt + timedelta(days=1)).strftime('%Y-%m-%d')
-        
-        print(f"  Searching ASF for {start} to {end}...")
-        
-        results = asf.search(
-            platform=[asf.PLATFORM.SENTINEL1],
-            intersectsWith=str(aoi_gdf.geometry.iloc[0]),
-            start=start,
-            end=end,
-            processingLevel='GRD_HD',
-            beamMode='IW',
-        )
-        
-        if not results:
+        # Scene from the shared search (+/- 1 day)
+        granule = scene_index.get(date_str)
+        if granule is None:
             print(f"  ✗ No scene found")
             failed.append(date_str)
             continue
         
-        granule = results[0]
         scene_name = granule.properties['sceneName']
         print(f"  Found: {scene_name}")
         print(f"  Downloading (~1 GB)...")
@@ -92,8 +77,7 @@ def download_safe_files(dates_to_download, overwrite=False):
             zip_path = ALL_RAW_DIR / f"{scene_name}.zip"
             if zip_path.exists():
                 print(f"  Extracting...")
-                with zipfile.ZipFile(zip_path, 'r') as z:
-                    z.extractall(ALL_RAW_DIR)
+                extract_zip(zip_path, ALL_RAW_DIR)
                 zip_path.unlink()
                 print(f"  ✓ Done: {scene_name}.SAFE")
                 downloaded.append(date_str)
@@ -115,6 +99,19 @@ def download_safe_files(dates_to_download, overwrite=False):
     return downloaded, skipped, failed
 
 
+def _dir_size(path):
+    """Total size in bytes of all files below path (os.scandir walk, no Path objects)."""
+    total, stack = 0, [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
 def verify_downloads():
     """Check which dates have SAFE files available."""
     print("\n" + "=" * 70)
@@ -124,7 +121,7 @@ def verify_downloads():
     for date_str in COMPARISON_DATES:
         safe_path = get_safe_path(date_str)
         if safe_path and safe_path.exists():
-            size_gb = sum(f.stat().st_size for f in safe_path.rglob('*')) / (1024**3)
+            size_gb = _dir_size(safe_path) / (1024**3)
             print(f"  ✓ {date_str}: {safe_path.name} ({size_gb:.2f} GB)")
         else:
             print(f"  ✗ {date_str}: Not found")
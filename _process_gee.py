@@ -1,8 +1,15 @@
 """
 GEE processing: s1_ard (Kartverket + Copernicus) and Standard GRD.
 """
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+import tempfile
+import zipfile
 import ee
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from _config import (
     GEE_PROJECT, OUTPUT_CRS, OUTPUT_RESOLUTION,
@@ -17,9 +24,17 @@ except ImportError:
     s1ard = None
     print("Warning: s1_ard module not found")
 
+# Shared HTTP session: keep-alive connections and retries on EE's transient 429/5xx
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16, pool_maxsize=16,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
 
+
+@lru_cache(maxsize=None)
 def get_ee_geometry(aoi_key):
-    """Get EE geometry from geojson AOI."""
+    """Get EE geometry from geojson AOI (built once per AOI)."""
     gdf = load_aoi(aoi_key).to_crs('EPSG:4326')
     geom = gdf.geometry.iloc[0]
     
@@ -33,19 +48,41 @@ def get_ee_geometry(aoi_key):
     return ee.Geometry.Polygon([coords])
 
 
-def download_image(image, band, geometry, output_path):
-    """Download a single band from EE image."""
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    url = image.select(band).getDownloadUrl({
+@lru_cache(maxsize=None)
+def _kartverket_dem(aoi_key):
+    """Kartverket DEM asset with a 'DEM' band; band names are fetched once per AOI."""
+    dem = ee.Image(GEE_DEM_ASSETS[aoi_key])
+    if 'DEM' not in dem.bandNames().getInfo():
+        dem = dem.select([0]).rename('DEM')
+    return dem
+
+
+def download_image(image, band_paths, geometry):
+    """Download several bands of an EE image in one request: band_paths = {band: output_path}."""
+    bands = list(band_paths)
+    url = image.select(bands).getDownloadUrl({
         'region': geometry,
         'crs': OUTPUT_CRS,
         'scale': OUTPUT_RESOLUTION,
-        'format': 'GEO_TIFF'
+        'format': 'ZIPPED_GEO_TIFF',
+        'filePerBand': True
     })
-    r = requests.get(url)
-    r.raise_for_status()
-    with open(output_path, 'wb') as f:
-        f.write(r.content)
+    # Stream the zip to a temp file in 1 MiB chunks instead of holding it in memory
+    with tempfile.TemporaryFile() as tmp:
+        with _SESSION.get(url, stream=True) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=1 << 20):
+                tmp.write(chunk)
+        
+        # One GeoTIFF per band, named <id>.<band>.tif
+        with zipfile.ZipFile(tmp) as z:
+            members = {name.rsplit('.', 2)[-2]: name for name in z.namelist() if name.endswith('.tif')}
+            for band, output_path in band_paths.items():
+                if band not in members:
+                    raise KeyError(f"Band {band} missing from download")
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                with z.open(members[band]) as src, open(output_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, length=1 << 20)
 
 
 def process_s1ard(date_str, aoi_key, dem_type='copernicus'):
@@ -77,9 +114,7 @@ def process_s1ard(date_str, aoi_key, dem_type='copernicus'):
         
         method_key = 'gee_s1ard_copernicus'
     else:
-        dem = ee.Image(GEE_DEM_ASSETS[aoi_key])
-        if 'DEM' not in dem.bandNames().getInfo():
-            dem = dem.select([0]).rename('DEM')
+        dem = _kartverket_dem(aoi_key)
         method_key = 'gee_s1ard_kartverket'
     
     params = {
@@ -109,13 +144,10 @@ def process_s1ard(date_str, aoi_key, dem_type='copernicus'):
     
     image = s1ard.s1_preproc(params).first()
     
-    for pol in ['vv', 'vh']:
-        out_path = get_gee_path(date_str, aoi_key, method_key, pol)
-        download_image(image, pol.upper(), geometry, out_path)
-
-    # Download local incidence angle band from edited terrain flattening
-    lia_path = get_gee_path(date_str, aoi_key, method_key, 'lia')
-    download_image(image, 'local_incidence_angle', geometry, lia_path)
+    # VV, VH and the local incidence angle band (from edited terrain flattening) in one download
+    band_paths = {pol.upper(): get_gee_path(date_str, aoi_key, method_key, pol) for pol in ['vv', 'vh']}
+    band_paths['local_incidence_angle'] = get_gee_path(date_str, aoi_key, method_key, 'lia')
+    download_image(image, band_paths, geometry)
 
 
 def process_standard(date_str, aoi_key):
@@ -138,43 +170,44 @@ def process_standard(date_str, aoi_key):
     vh = s1.select('VH').rename('VH')
     image = vv.addBands(vh).clip(geometry)
     
-    for pol in ['vv', 'vh']:
-        out_path = get_gee_path(date_str, aoi_key, 'gee_standard', pol)
-        download_image(image, pol.upper(), geometry, out_path)
+    band_paths = {pol.upper(): get_gee_path(date_str, aoi_key, 'gee_standard', pol) for pol in ['vv', 'vh']}
+    download_image(image, band_paths, geometry)
 
 
-def main():
+# (method_key, label, processing function) per GEE variant
+GEE_TASKS = [
+    ('gee_s1ard_copernicus', 'cop', partial(process_s1ard, dem_type='copernicus')),
+    ('gee_s1ard_kartverket', 'kart', partial(process_s1ard, dem_type='kartverket')),
+    ('gee_standard', 'std', process_standard),
+]
+
+
+def _run_task(task):
+    """Run one (date, aoi, variant) job; errors are reported, not raised."""
+    date_str, aoi_key, label, func = task
+    try:
+        func(date_str, aoi_key)
+        print(f"{date_str}/{aoi_key}/{label}: done")
+    except Exception as e:
+        print(f"{date_str}/{aoi_key}/{label}: {e}")
+
+
+def main(max_workers=8):
     ee.Authenticate()
     ee.Initialize(project=GEE_PROJECT)
     
     aoi_keys = list(AOI_FILES.keys())
     
-    for date_str in COMPARISON_DATES:
-        print(f"\nProcessing date: {date_str}")
-        for aoi_key in aoi_keys:
-            # s1_ard with Copernicus DEM
-            if not get_gee_path(date_str, aoi_key, 'gee_s1ard_copernicus', 'vv').exists():
-                try:
-                    process_s1ard(date_str, aoi_key, 'copernicus')
-                    print(f"{date_str}/{aoi_key}/cop: done")
-                except Exception as e:
-                    print(f"{date_str}/{aoi_key}/cop: {e}")
-            
-            # s1_ard with Kartverket DEM
-            if not get_gee_path(date_str, aoi_key, 'gee_s1ard_kartverket', 'vv').exists():
-                try:
-                    process_s1ard(date_str, aoi_key, 'kartverket')
-                    print(f"{date_str}/{aoi_key}/kart: done")
-                except Exception as e:
-                    print(f"{date_str}/{aoi_key}/kart: {e}")
-            
-            # Standard GRD
-            if not get_gee_path(date_str, aoi_key, 'gee_standard', 'vv').exists():
-                try:
-                    process_standard(date_str, aoi_key)
-                    print(f"{date_str}/{aoi_key}/std: done")
-                except Exception as e:
-                    print(f"{date_str}/{aoi_key}/std: {e}")
+    # I/O-bound (EE URL generation + HTTP), so independent jobs run in threads
+    tasks = [(date_str, aoi_key, label, func)
+             for date_str in COMPARISON_DATES
+             for aoi_key in aoi_keys
+             for method_key, label, func in GEE_TASKS
+             if not get_gee_path(date_str, aoi_key, method_key, 'vv').exists()]
+    print(f"Processing {len(tasks)} GEE jobs...")
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        list(ex.map(_run_task, tasks))
 
 
 if __name__ == "__main__":
@@ -2,15 +2,17 @@
 HyP3 RTC processing script.
 """
 import os
-import zipfile
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import numpy as np
 
 load_dotenv()
 
 from hyp3_sdk import HyP3
+from hyp3_sdk.exceptions import HyP3Error
 
 
 try:
@@ -22,6 +24,7 @@ from _config import (
     COMPARISON_DATES, AOI_FILES, MULTITEMP_HYP3_DIR,
     get_safe_path, get_hyp3_path, load_aoi
 )
+from _data_utils import extract_zip, build_scene_index
 
 
 def get_credentials():
@@ -33,43 +36,48 @@ def get_credentials():
     return username, password
 
 
-def search_asf_scene(date_str, aoi_key='jorde'):
-    """Search ASF for Sentinel-1 scene on given date."""
+def search_asf_scene(date_str, aoi_key='jorde', scene_index=None):
+    """Search ASF for Sentinel-1 scene on given date (or look it up in a prebuilt scene index)."""
     if asf is None:
         raise ImportError("asf_search required")
     
-    # Load AOI in WGS84 for ASF search
-    aoi_gdf = load_aoi(aoi_key).to_crs('EPSG:4326')
+    if scene_index is None:
+        scene_index = build_scene_index([date_str], aoi_key)
     
-    # Date range: +/- 1 day
-    date_dt = datetime.strptime(date_str, '%Y%m%d')
-    start = (date_dt - timedelta(days=1)).strftime('%Y-%m-%d')
-    end = (date_dt + timedelta(days=1)).strftime('%Y-%m-%d')
-    
-    results = asf.search(
-        platform=[asf.PLATFORM.SENTINEL1],
-        intersectsWith=str(aoi_gdf.geometry.iloc[0]),
-        start=start,
-        end=end,
-        processingLevel='GRD_HD',
-        beamMode='IW',
-    )
-    
-    if not results:
+    granule = scene_index.get(date_str)
+    if granule is None:
         return None
     
-    return results[0].properties['sceneName']
+    return granule.properties['sceneName']
+
+
+# RTC parameters shared by all submitted jobs
+RTC_PARAMS = dict(
+    resolution=10,
+    scale='power',
+    speckle_filter=False,
+    dem_name='copernicus',
+    dem_matching=False,
+    radiometry='gamma0',
+    include_dem=True,
+    include_inc_map=True,
+    include_scattering_area=True,
+)
 
 
 def submit_jobs(dates=None, overwrite=False):
-    """Submit HyP3 RTC jobs."""
+    """Submit HyP3 RTC jobs (all dates in one batched request, per date if the batch is rejected)."""
     
     username, password = get_credentials()
     hyp3 = HyP3(username=username, password=password)
     
     dates = dates or COMPARISON_DATES
-    existing_jobs = {job.name: job for job in hyp3.find_jobs()}
+    jobs = hyp3.find_jobs()
+    existing_jobs = {job.name: job for job in jobs}
+    known_ids = {job.job_id for job in jobs}
+    scene_index = None  # one ASF search for all dates, built on first miss
     
+    prepared = []
     for date_str in dates:
         if date_str == '20170707':
             overwrite = True
@@ -86,7 +94,9 @@ def submit_jobs(dates=None, overwrite=False):
         else:
             # If no local SAFE, search ASF
             try:
-                scene_name = search_asf_scene(date_str)
+                if scene_index is None:
+                    scene_index = build_scene_index(dates)
+                scene_name = search_asf_scene(date_str, scene_index=scene_index)
                 if not scene_name:
                     print(f"{date_str}: no scene found in ASF")
                     continue
@@ -94,36 +104,73 @@ def submit_jobs(dates=None, overwrite=False):
                 print(f"{date_str}: ASF search failed - {e}")
                 continue
         
+        prepared.append((date_str, scene_name,
+                         HyP3.prepare_rtc_job(granule=scene_name, name=job_name, **RTC_PARAMS)))
+    
+    if not prepared:
+        return
+    
+    try:
+        hyp3.submit_prepared_jobs([job for _, _, job in prepared])
+        for date_str, scene_name, _ in prepared:
+            print(f"{date_str}: submitted ({scene_name})")
+        return
+    except HyP3Error as e:
+        # 4xx: the API rejects the whole batch if one job is invalid; retry per date to skip only that one.
+        # Anything else (timeouts, 5xx) may have been accepted and propagates instead of being resubmitted.
+        print(f"Batch submit rejected ({e}), submitting per date")
+    
+    # Skip dates that got a job anyway since the first query
+    new_names = {job.name for job in hyp3.find_jobs() if job.job_id not in known_ids}
+    for date_str, scene_name, job in prepared:
+        if job['name'] in new_names:
+            print(f"{date_str}: already submitted")
+            continue
         try:
-            hyp3.submit_rtc_job(
-                granule=scene_name,
-                name=job_name,
-                resolution=10,
-                scale='power',
-                speckle_filter=False,
-                dem_name='copernicus',
-                dem_matching=False,
-                radiometry='gamma0',
-                include_dem=True,
-                include_inc_map=True,
-                include_scattering_area=True,
-            )
+            hyp3.submit_prepared_jobs([job])
             print(f"{date_str}: submitted ({scene_name})")
         except Exception as e:
             print(f"{date_str}: {e}")
 
 
-def download_jobs(dates=None):
-    """Download completed HyP3 jobs."""
+def _download_one(job, output_dir):
+    """Download one job's zip(s) into output_dir."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    job.download_files(str(output_dir))
+
+
+def _extract_worker(q):
+    """Extract downloaded zips as they arrive on q, until the None sentinel."""
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        date_str, output_dir = item
+        try:
+            for zf in output_dir.glob('*.zip'):
+                # HyP3 zips hold several rasters (VV, VH, inc_map, ls_map, dem, ...)
+                extract_zip(zf, output_dir, max_workers=4)
+                zf.unlink()
+            print(f"{date_str}: downloaded")
+        except Exception as e:
+            print(f"{date_str}: extraction failed - {e}")
+
+
+def find_jobs():
+    """All HyP3 jobs for the configured user (one API listing, shareable between steps)."""
+    username, password = get_credentials()
+    return HyP3(username=username, password=password).find_jobs()
+
+
+def download_jobs(dates=None, max_workers=4, jobs=None):
+    """Download completed HyP3 jobs (several dates concurrently)."""
     if HyP3 is None:
         raise ImportError("hyp3_sdk required")
     
-    username, password = get_credentials()
-    hyp3 = HyP3(username=username, password=password)
-    
     dates = dates or COMPARISON_DATES
-    jobs = {job.name: job for job in hyp3.find_jobs()}
+    jobs = {job.name: job for job in (jobs if jobs is not None else find_jobs())}
     
+    pending = []
     for date_str in dates:
 
         job_name = f"Thesis_RTC_{date_str}"
@@ -142,27 +189,109 @@ def download_jobs(dates=None):
             print(f"{date_str}: exists")
             continue
         
-        output_dir.mkdir(parents=True, exist_ok=True)
-        job.download_files(str(output_dir))
-        
-        # Extract zips
-        for zf in output_dir.glob('*.zip'):
-            with zipfile.ZipFile(zf, 'r') as z:
-                z.extractall(output_dir)
-            zf.unlink()
-        
-        print(f"{date_str}: downloaded")
+        pending.append((date_str, job, output_dir))
+    
+    # Pipeline: download threads (network-bound, shared HyP3 session) feed a single
+    # extraction thread (disk-bound), so extraction overlaps the remaining downloads
+    q = queue.Queue()
+    extractor = threading.Thread(target=_extract_worker, args=(q,), daemon=True)
+    extractor.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = {ex.submit(_download_one, job, output_dir): (date_str, output_dir)
+                       for date_str, job, output_dir in pending}
+            for fut in as_completed(futures):
+                date_str, output_dir = futures[fut]
+                try:
+                    fut.result()
+                    q.put((date_str, output_dir))
+                except Exception as e:
+                    print(f"{date_str}: download failed - {e}")
+    finally:
+        q.put(None)
+        extractor.join()
 
 
-def crop_to_aois(dates=None, overwrite=False):
-    """Crop downloaded HyP3 data to AOIs, reprojecting to OUTPUT_CRS."""
+def _crop_one(task):
+    """Crop (and if needed reproject) one HyP3 file to one AOI; one thread-pool task."""
     import rasterio
+    from rasterio.features import geometry_mask
     from rasterio.mask import mask
-    from rasterio.warp import reproject, Resampling
+    from rasterio.vrt import WarpedVRT
+    from rasterio.warp import Resampling
     from _config import OUTPUT_CRS
     
+    date_str, aoi_key, gdf, file_type, input_path, output_path = task
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    try:
+        with rasterio.open(input_path) as src:
+            needs_reproject = str(src.crs) != OUTPUT_CRS
+            
+            if needs_reproject:
+                print(f"  {date_str}/{aoi_key}/{file_type}: reprojecting {src.crs} -> {OUTPUT_CRS}")
+                gdf_dst = gdf.to_crs(OUTPUT_CRS)
+                dst_bounds = gdf_dst.total_bounds
+                
+                dst_width = int(np.ceil((dst_bounds[2] - dst_bounds[0]) / 10))
+                dst_height = int(np.ceil((dst_bounds[3] - dst_bounds[1]) / 10))
+                dst_transform = rasterio.transform.from_bounds(
+                    dst_bounds[0], dst_bounds[1], 
+                    dst_bounds[2], dst_bounds[3],
+                    dst_width, dst_height
+                )
+                
+                # Crop + reproject in one warped read of just the AOI grid
+                with WarpedVRT(src, crs=OUTPUT_CRS, transform=dst_transform,
+                               width=dst_width, height=dst_height,
+                               src_nodata=0, nodata=0,
+                               resampling=Resampling.bilinear) as vrt:
+                    data = vrt.read()
+                
+                # Zero outside the AOI polygon, as mask(filled=True, nodata=0) does
+                outside = geometry_mask(gdf_dst.geometry, out_shape=(dst_height, dst_width),
+                                        transform=dst_transform)
+                data[:, outside] = 0
+                transform = dst_transform
+                crs = OUTPUT_CRS
+            else:
+                # crop=True reads only the AOI's pixel window (geometry_window), not the full scene
+                gdf_src = gdf.to_crs(src.crs)
+                data, transform = mask(src, gdf_src.geometry, crop=True, 
+                                      filled=True, nodata=0)
+                crs = src.crs
+            
+            profile = src.profile.copy()
+            profile.update(
+                height=data.shape[1],
+                width=data.shape[2],
+                transform=transform,
+                crs=crs,
+                nodata=0,
+                # Tiled + compressed so downstream (windowed) reads touch only needed tiles
+                tiled=True,
+                blockxsize=512,
+                blockysize=512,
+                compress='zstd',
+                zstd_level=3,
+                predictor=3 if np.dtype(data.dtype).kind == 'f' else 2,
+                BIGTIFF='IF_SAFER'
+            )
+            
+            with rasterio.open(output_path, 'w', **profile) as dst:
+                dst.write(data)
+                
+    except Exception as e:
+        print(f"Error cropping {file_type} for {date_str}: {e}")
+
+
+def crop_to_aois(dates=None, overwrite=False, max_workers=None):
+    """Crop downloaded HyP3 data to AOIs, reprojecting to OUTPUT_CRS."""
     dates = dates or COMPARISON_DATES
     
+    # Independent (date, aoi, file) crops; GDAL releases the GIL, so threads run them in parallel
+    aoi_gdfs = {aoi_key: load_aoi(aoi_key) for aoi_key in AOI_FILES}
+    tasks, dates_done = [], []
     for date_str in dates:
         date_dir = MULTITEMP_HYP3_DIR / date_str
         if not date_dir.exists():
@@ -189,8 +318,6 @@ def crop_to_aois(dates=None, overwrite=False):
         }
         
         for aoi_key in AOI_FILES.keys():
-            gdf = load_aoi(aoi_key)
-            
             for file_type, input_path in input_files.items():
                 if not input_path.exists():
                     continue
@@ -200,65 +327,16 @@ def crop_to_aois(dates=None, overwrite=False):
                 if output_path.exists() and not overwrite:
                     continue
                 
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                try:
-                    with rasterio.open(input_path) as src:
-                        needs_reproject = str(src.crs) != OUTPUT_CRS
-                        
-                        if needs_reproject:
-                            print(f"  {date_str}/{aoi_key}/{file_type}: reprojecting {src.crs} -> {OUTPUT_CRS}")
-                        
-                        gdf_src = gdf.to_crs(src.crs)
-                        data, transform = mask(src, gdf_src.geometry, crop=True, 
-                                              filled=True, nodata=0)
-                        
-                        if needs_reproject:
-                            gdf_dst = gdf.to_crs(OUTPUT_CRS)
-                            dst_bounds = gdf_dst.total_bounds
-                            
-                            dst_width = int(np.ceil((dst_bounds[2] - dst_bounds[0]) / 10))
-                            dst_height = int(np.ceil((dst_bounds[3] - dst_bounds[1]) / 10))
-                            dst_transform = rasterio.transform.from_bounds(
-                                dst_bounds[0], dst_bounds[1], 
-                                dst_bounds[2], dst_bounds[3],
-                                dst_width, dst_height
-                            )
-                            
-                            dst_data = np.zeros((data.shape[0], dst_height, dst_width), dtype=data.dtype)
-                            reproject(
-                                source=data,
-                                destination=dst_data,
-                                src_transform=transform,
-                                src_crs=src.crs,
-                                dst_transform=dst_transform,
-                                dst_crs=OUTPUT_CRS,
-                                resampling=Resampling.bilinear
-                            )
-                            data = dst_data
-                            transform = dst_transform
-                            crs = OUTPUT_CRS
-                        else:
-                            crs = src.crs
-                        
-                        profile = src.profile.copy()
-                        profile.update(
-                            height=data.shape[1],
-                            width=data.shape[2],
-                            transform=transform,
-                            crs=crs,
-                            nodata=0
-                        )
-                        
-                        with rasterio.open(output_path, 'w', **profile) as dst:
-                            dst.write(data)
-                            
-                except Exception as e:
-                    print(f"Error cropping {file_type} for {date_str}: {e}")
-        
+                tasks.append((date_str, aoi_key, aoi_gdfs[aoi_key], file_type, input_path, output_path))
+        dates_done.append(date_str)
+    
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        list(ex.map(_crop_one, tasks))
+    
+    for date_str in dates_done:
         print(f"{date_str}: cropped")
 
-def check_status():
+def check_status(jobs=None):
     """Print status of HyP3 processing."""
     print("HyP3 File Availability:")
     for date_str in COMPARISON_DATES:
@@ -267,10 +345,10 @@ def check_status():
         status = 'OK' if hyp3_exists else 'MISSING'
         print(f"  {date_str}: {status}")
 
-    hyp3 = HyP3(username=os.getenv('HYP3USERNAME'), password=os.getenv('HYP3PASSWORD'))
     print("\nRecent HyP3 Jobs:")
-    jobs = hyp3.find_jobs()
-    for job in jobs[:20]:
+    if jobs is None:
+        jobs = find_jobs()
+    for job in list(jobs)[:20]:
         print(f"  {job.name:<30} | {job.status_code:<10} | {job.job_id}")
 
 
@@ -287,7 +365,6 @@ if __name__ == "__main__":
     if args.submit:
         submit_jobs()
     elif args.download:
-        hyp3 = HyP3(username=os.getenv('HYP3USERNAME'), password=os.getenv('HYP3PASSWORD'))
         download_jobs()
     elif args.crop:
         crop_to_aois()
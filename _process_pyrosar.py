@@ -3,6 +3,7 @@ PyroSAR/SNAP processing with Kartverket and Copernicus DEMs.
 Run in conda pyrosar environment.
 """
 import json
+import multiprocessing
 import tempfile
 import os
 from _config import (
@@ -108,25 +109,28 @@ def process_pyrosar(date_str, aoi_key, dem_type='kartverket'):
         os.remove(shapefile)
 
 
-def main():
-    aoi_keys = list(AOI_FILES.keys())
+def _run_task(date_str, aoi_key, dem_type):
+    """One geocode run in a worker process; errors are reported, not raised."""
+    label = 'kart' if dem_type == 'kartverket' else 'cop'
+    try:
+        if process_pyrosar(date_str, aoi_key, dem_type):
+            print(f"{date_str}/{aoi_key}/{label}: done", flush=True)
+    except Exception as e:
+        print(f"{date_str}/{aoi_key}/{label}: {e}", flush=True)
 
-    for date_str in COMPARISON_DATES:
-        for aoi_key in aoi_keys:
-
-            # Kartverket DEM
-            try:
-                if process_pyrosar(date_str, aoi_key, 'kartverket'):
-                    print(f"{date_str}/{aoi_key}/kart: done")
-            except Exception as e:
-                print(f"{date_str}/{aoi_key}/kart: {e}")
-
-            # Copernicus DEM
-            try:
-                if process_pyrosar(date_str, aoi_key, 'copernicus'):
-                    print(f"{date_str}/{aoi_key}/cop: done")
-            except Exception as e:
-                print(f"{date_str}/{aoi_key}/cop: {e}")
+
+def main(processes=None):
+    aoi_keys = list(AOI_FILES.keys())
+    tasks = [(date_str, aoi_key, dem_type)
+             for date_str in COMPARISON_DATES
+             for aoi_key in aoi_keys
+             for dem_type in ('kartverket', 'copernicus')]
+
+    # Each geocode call runs its own SNAP JVM; cap workers for SNAP's RAM footprint.
+    # Temp AOI files are unique per call (NamedTemporaryFile), so workers don't collide.
+    processes = processes or max(1, min((os.cpu_count() or 2) // 2, 4))
+    with multiprocessing.get_context('spawn').Pool(processes=processes) as pool:
+        pool.starmap(_run_task, tasks)
 
 
 if __name__ == "__main__":